@@ -0,0 +1,1357 @@
+"""
+Benchmarks: Latency of the toggle path and of the API calls.
+
+startup (default) measures, from exec of a fresh interpreter:
+- stop:    CLI toggle -> SIGTERM delivered to a running recorder
+- socket:  CLI toggle -> command received by a resident daemon
+- capture: worker (--daemon) -> first audio callback
+plus a -X importtime breakdown of the CLI.
+
+listen compares the idle CPU of a resident daemon with and without
+pre-roll listening (--preroll).
+
+toggle fires hundreds of presses per second from several threads at the
+toggle protocol (toggle.py) with fake workers, with and without debouncing,
+and checks that no two ever capture at once and none is left behind.
+
+cleanup runs the `cleanup` template on sample transcripts through the local
+pass (cleanup.py) and through the chat model (a stand-in answering in 400 ms),
+and fails when the local pass doesn't give the expected text.
+
+typing types text through a fake xdotool that takes a fixed time per key,
+once in a single call (the old fallback) and through typer.py, with and
+without a run that stalls partway, and fails when the text doesn't arrive
+complete (or more than the stalled run's part of a chunk is typed twice).
+
+api sends transcriptions to a local stand-in for the OpenAI API that injects
+delays and 5xx errors, with and without retries/hedging (see retry.py).
+
+batch runs `whispaste transcribe` on long 44.1 kHz PCM16 and 22.05 kHz float
+WAVs (parsing, splitting, encoding every segment) and checks stitch().
+
+insert pastes text through Injector.insert() into fake wl-copy/wl-paste/
+wtype and fails when its median goes over INSERT_BUDGET, the text doesn't
+arrive, PRIMARY isn't restored or the clipboard is written at all.
+
+memory feeds an hour of audio through BlockBuffer, VAD and each upload
+encoder and fails when the peak memory is over MEMORY_BUDGET times the raw
+samples (i.e. when the recording gets copied).
+
+preconnect uploads right after a recording to an HTTPS stand-in that counts
+TLS handshakes, with and without AudioEngine.preconnect(); it fails when the
+upload still has to open a connection.
+
+e2e runs whole sessions, hotkey to text in the window, through the real CLI
+and worker: a WAV fixture (--wav, or a synthetic one) replayed by the fake
+microphone, the API stand-in, and fake wl-copy/wl-paste/wtype. It reports
+the per-phase medians from stats.jsonl and checks the pasted text.
+
+Runs against a fake sounddevice and a throwaway config directory, so no
+microphone, API key, network or desktop session is touched.
+
+    python tests/bench.py [startup] [api] [preconnect] [batch] [insert] [memory] [listen] [typing] [cleanup] [toggle] [e2e] [--runs N] [--budget-stop MS] ...
+
+Exits non-zero when a startup or e2e median exceeds its budget (or a
+suite's check fails).
+Lives under tests/ so the fakes aren't shipped; imports whispaste from the
+checkout it is in.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import ssl
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Default budgets in milliseconds (median of --runs)
+BUDGETS = {'stop': 150, 'socket': 150, 'capture': 500}
+# Same for the e2e phases, in every scenario (see bench_e2e)
+E2E_BUDGETS = {'hotkey': 1000, 'backup': 100, 'paste': 150, 'overhead': 250}
+# Median of Injector.insert(), text to "Done!" (see bench_insert)
+INSERT_BUDGET = 150
+# Peak memory of a one-hour recording, relative to its raw samples (see bench_memory)
+MEMORY_BUDGET = 1.25
+
+# Stands in for the real module: delivers 20 ms blocks in real time and
+# stamps the wall-clock time of the first callback into $WHISPASTE_BENCH_STAMP.
+# The blocks replay the WAV file $WHISPASTE_BENCH_WAV from the start of each
+# stream (silence after its end), or are silent without one.
+FAKE_SOUNDDEVICE = '''
+import os, threading, time, wave
+import numpy as np
+
+class PortAudioError(Exception):
+    pass
+
+def sleep(ms):
+    time.sleep(ms / 1000)
+
+def query_devices():
+    return []
+
+def _initialize():
+    pass
+
+def _terminate():
+    pass
+
+def _fixture(samplerate):
+    """$WHISPASTE_BENCH_WAV as int16 mono at samplerate, or None."""
+    path = os.environ.get('WHISPASTE_BENCH_WAV')
+    if not path:
+        return None
+    with wave.open(path) as f:
+        rate, channels = f.getframerate(), f.getnchannels()
+        samples = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+    samples = samples.reshape(-1, channels).mean(axis=1)
+    if rate != samplerate:
+        positions = np.arange(int(len(samples) * samplerate / rate)) * rate / samplerate
+        samples = np.interp(positions, np.arange(len(samples)), samples)
+    return samples.astype(np.int16)
+
+class InputStream:
+    def __init__(self, samplerate, channels, dtype, callback, blocksize=0, **kwargs):
+        self.blocksize = blocksize or int(samplerate * 0.02)
+        self.period = self.blocksize / samplerate
+        self.shape = (self.blocksize, channels)
+        self.dtype = dtype
+        self.callback = callback
+        self.active = False
+        self.fixture = _fixture(samplerate)
+
+    def block(self, index):
+        block = np.zeros(self.shape, dtype=self.dtype)
+        if self.fixture is not None:
+            piece = self.fixture[index * self.blocksize:(index + 1) * self.blocksize]
+            block[:len(piece)] = piece[:, None]
+        return block
+
+    def run(self):
+        first = True
+        index = 0
+        next_block = time.monotonic()
+        while self.active:
+            self.callback(self.block(index), self.shape[0], None, None)
+            index += 1
+            if first:
+                first = False
+                stamp = os.environ.get('WHISPASTE_BENCH_STAMP')
+                if stamp:
+                    with open(stamp, 'w') as f:
+                        f.write(repr(time.time()))
+            next_block += self.period
+            time.sleep(max(0, next_block - time.monotonic()))
+
+    def start(self):
+        self.active = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.active = False
+        self.thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+'''
+
+# Registers as the recorder like a worker and stamps when SIGTERM arrives
+FAKE_RECORDER = '''
+import signal, sys, time
+from whispaste import toggle
+stamp = sys.argv[1]
+def stop(signum, frame):
+    with open(stamp, 'w') as f:
+        f.write(repr(time.time()))
+    sys.exit(0)
+signal.signal(signal.SIGTERM, stop)
+toggle.register()
+while True:
+    signal.pause()
+'''
+
+# The worker's side of the toggle protocol with a fake capture: records
+# until SIGTERM (or 5 s), appending "pid start end" of its capture to argv[1]
+FAKE_TOGGLE_WORKER = '''
+import os, signal, sys, threading, time
+signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+from whispaste import toggle
+stop = threading.Event()
+threading.Thread(target=lambda: (signal.sigwait({signal.SIGTERM}), stop.set()), daemon=True).start()
+if toggle.register() is not None:
+    start = time.time()
+    stop.wait(5)
+    end = time.time()
+    with open(sys.argv[1], 'a') as f:
+        f.write(f"{os.getpid()} {start} {end}\\n")
+    toggle.captured()
+    time.sleep(0.05)
+toggle.finished()
+'''
+
+# Stands in for xdotool: "types" its last argument into $WHISPASTE_BENCH_TYPED,
+# ten keys at a time at --delay ms per key (12 by default, like xdotool). If
+# $WHISPASTE_BENCH_STALL exists it is removed and the run hangs after ten keys.
+FAKE_XDOTOOL = '''#!/bin/sh
+delay=12; prev=; text=
+for arg in "$@"; do
+    [ "$prev" = "--delay" ] && delay=$arg
+    prev=$arg; text=$arg
+done
+pause=$(awk "BEGIN { print 10 * $delay / 1000 }")
+while [ -n "$text" ]; do
+    if [ ${#text} -le 10 ]; then piece=$text; else piece=${text%"${text#??????????}"}; fi
+    text=${text#"$piece"}
+    sleep "$pause"
+    printf '%s' "$piece" >> "$WHISPASTE_BENCH_TYPED"
+    if [ -e "$WHISPASTE_BENCH_STALL" ]; then
+        rm -f "$WHISPASTE_BENCH_STALL"
+        exec sleep 60
+    fi
+done
+'''
+
+# Stands in for wl-copy, wl-paste and wtype (installed under all three names):
+# selections are files in $WHISPASTE_BENCH_DESKTOP, what is pasted or typed
+# is appended to its "window" file, and every call appends "time tool op" to
+# $WHISPASTE_BENCH_EVENTS.
+FAKE_DESKTOP = '''#!/bin/sh
+desk=$WHISPASTE_BENCH_DESKTOP
+tool=${0##*/}
+selection=clipboard; op=; text=; literal=
+for arg in "$@"; do
+    if [ -n "$literal" ]; then text=$arg; continue; fi
+    case $arg in
+        --primary) selection=primary ;;
+        --list-types) op=types ;;
+        -k) op=paste ;;
+        --) literal=1; op=type ;;
+    esac
+done
+log() { echo "$(date +%s.%N) $tool $1" >> "$WHISPASTE_BENCH_EVENTS"; }
+case $tool in
+    wl-copy)
+        cat > "$desk/$selection"
+        log "copy-$selection" ;;
+    wl-paste)
+        [ -s "$desk/$selection" ] || exit 1
+        if [ "$op" = types ]; then echo 'text/plain;charset=utf-8'; else cat "$desk/$selection"; fi ;;
+    wtype)
+        if [ "$op" = paste ]; then cat "$desk/primary" >> "$desk/window"; else printf '%s' "$text" >> "$desk/window"; fi
+        log "${op:-key}" ;;
+esac
+'''
+
+def wait_for(path: Path, timeout: float = 10) -> float:
+    """Poll for a stamp file and return the time written into it."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            text = path.read_text()
+            if text:
+                return float(text)
+        except (OSError, ValueError):
+            pass
+        time.sleep(0.002)
+    raise TimeoutError(f"{path.name} never appeared")
+
+class Sandbox:
+    """
+    Temp dir with the fake sounddevice on PYTHONPATH and its own
+    XDG_CONFIG_HOME, so whispaste's PID/socket/opts files live there.
+    """
+    def __init__(self):
+        self.tmp = tempfile.TemporaryDirectory(prefix='whispaste-bench-')
+        self.root = Path(self.tmp.name)
+        (self.root / 'fake').mkdir()
+        (self.root / 'fake' / 'sounddevice.py').write_text(FAKE_SOUNDDEVICE)
+        self.config = self.root / 'whispaste'
+        self.config.mkdir()
+
+        package_root = str(Path(__file__).resolve().parent.parent)
+        self.env = {k: v for k, v in os.environ.items()
+                    if k not in ('OPENAI_API_KEY', 'DISPLAY', 'WAYLAND_DISPLAY', 'DBUS_SESSION_BUS_ADDRESS')}
+        self.env.update({
+            'PYTHONPATH': os.pathsep.join([str(self.root / 'fake'), package_root]),
+            'XDG_CONFIG_HOME': str(self.root),
+            'WHISPASTE_BACKEND': 'openai',
+        })
+
+    def cli(self, *args) -> List[str]:
+        return [sys.executable, '-m', 'whispaste', *args]
+
+    def run(self, *args, **kwargs) -> subprocess.Popen:
+        # cwd is the sandbox so load_dotenv() can't pick up a project .env
+        return subprocess.Popen(self.cli(*args), env=self.env, cwd=self.root,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+
+    def clear(self):
+        for name in ('state.json', 'daemon.sock', 'stamp'):
+            (self.config / name).unlink(missing_ok=True)
+
+    def close(self):
+        self.tmp.cleanup()
+
+def bench_stop(box: Sandbox) -> float:
+    """CLI exec -> SIGTERM received by the running recorder."""
+    from whispaste import toggle
+
+    box.clear()
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    stamp = box.config / 'stamp'
+    recorder = subprocess.Popen([sys.executable, '-c', FAKE_RECORDER, str(stamp)], env=box.env, cwd=box.root)
+    try:
+        deadline = time.monotonic() + 10
+        while not toggle.read_state().get('ready'):
+            if time.monotonic() > deadline:
+                raise TimeoutError("fake recorder never registered")
+            time.sleep(0.002)
+        start = time.time()
+        box.run().wait()
+        return wait_for(stamp) - start
+    finally:
+        recorder.kill()
+        recorder.wait()
+
+def bench_socket(box: Sandbox) -> float:
+    """CLI exec -> toggle command read by a listening daemon."""
+    from whispaste import control
+
+    box.clear()
+    received = []
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(box.config / 'daemon.sock'))
+    server.listen(1)
+
+    def accept():
+        conn, _ = server.accept()
+        with conn:
+            line = conn.makefile('rb').readline()
+            received.append(time.time())
+            control.decode(line)
+            conn.sendall(control.encode({'ok': True, 'state': 'recording'}))
+
+    listener = threading.Thread(target=accept, daemon=True)
+    listener.start()
+    try:
+        start = time.time()
+        box.run().wait()
+        listener.join(10)
+        if not received:
+            raise TimeoutError("daemon socket never got the toggle")
+        return received[0] - start
+    finally:
+        server.close()
+
+def bench_capture(box: Sandbox) -> float:
+    """Worker exec -> first audio callback."""
+    box.clear()
+    stamp = box.config / 'stamp'
+    box.env['WHISPASTE_BENCH_STAMP'] = str(stamp)
+    try:
+        start = time.time()
+        worker = box.run('--daemon')
+        try:
+            return wait_for(stamp) - start
+        finally:
+            # Stops recording; with no API key the worker exits without uploading
+            worker.send_signal(signal.SIGTERM)
+            try:
+                worker.wait(10)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+                worker.wait()
+    finally:
+        del box.env['WHISPASTE_BENCH_STAMP']
+
+def import_times(box: Sandbox, top: int = 12) -> List[Dict]:
+    """
+    Cumulative import time of the CLI's modules (python -X importtime),
+    slowest first.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import whispaste.__main__'],
+        env=box.env, cwd=box.root, capture_output=True, text=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[0].startswith('import time:'):
+            continue
+        try:
+            own, cumulative = int(parts[0].split(':')[1]), int(parts[1])
+        except ValueError:
+            continue  # Header line
+        name = parts[2].rstrip()
+        rows.append({'module': name.strip(), 'depth': (len(name) - len(name.lstrip())) // 2,
+                     'self': own / 1000, 'cumulative': cumulative / 1000})
+    return sorted(rows, key=lambda r: r['cumulative'], reverse=True)[:top]
+
+BENCHMARKS = {'stop': bench_stop, 'socket': bench_socket, 'capture': bench_capture}
+
+class StandIn:
+    """
+    Local stand-in for the OpenAI API (transcriptions and chat completions).
+    Each request fails with a 500 with probability error_rate, and takes
+    slow_seconds instead of delay with probability slow_rate.
+    Chat completions answer chat_text after chat_delay (both default to the
+    transcription's); streamed ones send it word by word, token_delay apart.
+    With tls (a server-side SSLContext) it speaks HTTPS. Every accepted
+    connection (TLS handshake) is counted and takes connect_delay, standing
+    in for the round trips of a real TCP/TLS setup.
+    """
+    def __init__(self, delay: float = 0.05, slow_rate: float = 0.0, slow_seconds: float = 1.0,
+                 error_rate: float = 0.0, text: str = 'stand-in transcript', seed: int = 0,
+                 chat_delay: Optional[float] = None, chat_text: Optional[str] = None, token_delay: float = 0.0,
+                 tls: Optional[ssl.SSLContext] = None, connect_delay: float = 0.0):
+        self.delay, self.slow_rate, self.slow_seconds = delay, slow_rate, slow_seconds
+        self.error_rate, self.text = error_rate, text
+        self.chat_delay = delay if chat_delay is None else chat_delay
+        self.chat_text = text if chat_text is None else chat_text
+        self.token_delay = token_delay
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        stand_in = self
+
+        class Server(ThreadingHTTPServer):
+            def get_request(self):
+                # With TLS, accept() returns after the handshake
+                request = super().get_request()
+                time.sleep(connect_delay)
+                with stand_in.lock:
+                    stand_in.connections += 1
+                return request
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # Keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def do_POST(self):
+                request = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                status, body, content_type = stand_in.respond(self.path, request)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                if isinstance(body, bytes):
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for event in body:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(event), event))
+                    self.wfile.flush()
+                self.wfile.write(b'0\r\n\r\n')
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        if tls is not None:
+            self.server.socket = tls.wrap_socket(self.server.socket, server_side=True)
+        self.url = f"{'https' if tls else 'http'}://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def respond(self, path: str, request: bytes = b''):
+        """(status, body, content type); the body is an iterator of events when streamed."""
+        transcription = path.endswith('/audio/transcriptions')
+        with self.lock:
+            self.requests += 1
+            failing = self.random.random() < self.error_rate
+            slow = self.random.random() < self.slow_rate
+        time.sleep(self.slow_seconds if slow else self.delay if transcription else self.chat_delay)
+        if failing:
+            return 500, json.dumps({'error': {'message': 'injected failure'}}).encode(), 'application/json'
+        if transcription:
+            return 200, self.text.encode(), 'text/plain'
+        try:
+            streamed = json.loads(request).get('stream')
+        except ValueError:
+            streamed = False
+        if streamed:
+            return 200, self.events(), 'text/event-stream'
+        completion = {
+            'id': 'stand-in', 'object': 'chat.completion', 'created': int(time.time()), 'model': 'stand-in',
+            'choices': [{'index': 0, 'finish_reason': 'stop',
+                         'message': {'role': 'assistant', 'content': self.chat_text}}],
+        }
+        return 200, json.dumps(completion).encode(), 'application/json'
+
+    def events(self):
+        """Server-sent chat.completion.chunk events, one word each."""
+        words = self.chat_text.split(' ')
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(self.token_delay)
+            chunk = {
+                'id': 'stand-in', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': 'stand-in',
+                'choices': [{'index': 0, 'finish_reason': None,
+                             'delta': {'content': word if not index else ' ' + word}}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n".encode()
+        yield b'data: [DONE]\n\n'
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def process_cpu(pid: int) -> Optional[float]:
+    """CPU seconds used by a process so far (Linux /proc), None elsewhere."""
+    try:
+        fields = Path(f"/proc/{pid}/stat").read_text().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def bench_listen(box: Sandbox, preroll_ms: int = 500, idle: float = 5.0) -> List[Dict]:
+    """
+    Idle CPU of a resident daemon with and without pre-roll listening, and
+    the daemon's own accounting of the listening stream.
+    """
+    from whispaste import control
+
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    results = []
+    for preroll in (0, preroll_ms):
+        box.clear()
+        daemon = box.run('--serve', '--preroll', str(preroll))
+        try:
+            deadline = time.monotonic() + 10
+            while control.send_command('status') is None:
+                if time.monotonic() > deadline:
+                    raise TimeoutError("daemon never came up")
+                time.sleep(0.05)
+            start = process_cpu(daemon.pid)
+            time.sleep(idle)
+            used = process_cpu(daemon.pid)
+            status = control.send_command('status') or {}
+        finally:
+            daemon.terminate()
+            daemon.wait(10)
+        results.append({
+            'preroll_ms': preroll,
+            'idle_cpu_percent': None if start is None or used is None else (used - start) / idle * 100,
+            'listening': status.get('listening'),
+        })
+    return results
+
+# (label, settings) compared by the api suite
+API_SCENARIOS = [
+    ('single attempt', {'WHISPASTE_RETRIES': '0', 'WHISPASTE_HEDGE': 'off'}),
+    ('retries', {'WHISPASTE_RETRIES': '2', 'WHISPASTE_HEDGE': 'off'}),
+    ('retries + hedge', {'WHISPASTE_RETRIES': '2', 'WHISPASTE_HEDGE': 'auto'}),
+]
+
+def bench_api(box: Sandbox, calls: int = 60) -> List[Dict]:
+    """
+    Transcribe 5 s of audio calls times per scenario against a stand-in that
+    fails 10% of requests and stalls another 10%.
+    """
+    import numpy as np
+    from openai import OpenAI
+    from whispaste import encoders, retry, stats, transcribers
+
+    # Settings and stats.jsonl (hedge history) come from the sandbox
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    os.environ.setdefault('WHISPASTE_TIMEOUT', '5')
+    payload = encoders.encode(np.zeros(16000 * 5, dtype=np.int16), 16000, 'wav')
+
+    results = []
+    for label, settings in API_SCENARIOS:
+        os.environ.update(settings)
+        retry.LATENCY.clear()
+        stand_in = StandIn(delay=0.05, slow_rate=0.1, slow_seconds=1.0, error_rate=0.1)
+        client = OpenAI(api_key='stand-in', base_url=stand_in.url, max_retries=0)
+        transcriber = transcribers.OpenAITranscriber(lambda: client)
+        samples, failures = [], 0
+        try:
+            for _ in range(calls):
+                start = time.perf_counter()
+                try:
+                    transcriber.transcribe(payload, 16000)
+                    samples.append((time.perf_counter() - start) * 1000)
+                except Exception:
+                    failures += 1
+        finally:
+            requests = stand_in.requests
+            stand_in.close()
+        results.append({'scenario': label, 'ok': len(samples), 'failed': failures, 'requests': requests,
+                        **({f'p{p}': stats.percentile(samples, p) for p in (50, 95, 99)} if samples else {})})
+    return results
+
+# (label, text) pasted by the insert suite
+INSERT_SCENARIOS = [
+    ('sentence', 'Let me check the numbers and get back to you by Friday.'),
+    ('paragraph', ' '.join(['We moved the launch to Tuesday so QA has two more days with the build.'] * 30)),
+]
+INSERT_CLIPBOARD = 'what the user had copied'
+
+def bench_insert(box: Sandbox, runs: int = 5) -> List[Dict]:
+    """
+    Injector.insert() into the fake wl-copy/wl-paste/wtype: time until it
+    returns ("Done!") with its backup and paste phases, and whether the text
+    reached the window, PRIMARY was restored afterwards and the clipboard
+    was never written (rewriting it would drop the owner's other formats).
+    """
+    from whispaste import backends, stats
+    from whispaste.injector import Injector
+
+    bin_dir = box.root / 'bin'
+    bin_dir.mkdir(exist_ok=True)
+    for tool in ('wl-copy', 'wl-paste', 'wtype'):
+        (bin_dir / tool).write_text(FAKE_DESKTOP)
+        (bin_dir / tool).chmod(0o755)
+    desktop, events = box.root / 'desktop', box.root / 'events'
+    desktop.mkdir(exist_ok=True)
+    os.environ.update({'XDG_CONFIG_HOME': box.env['XDG_CONFIG_HOME'], 'WAYLAND_DISPLAY': 'bench',
+                       'PATH': os.pathsep.join([str(bin_dir), os.environ.get('PATH', '')]),
+                       'WHISPASTE_BENCH_DESKTOP': str(desktop), 'WHISPASTE_BENCH_EVENTS': str(events)})
+    os.environ.pop('DISPLAY', None)
+    backends.invalidate()
+
+    results = []
+    for label, text in INSERT_SCENARIOS:
+        samples: Dict[str, List[float]] = {'insert': [], 'backup': [], 'paste': []}
+        failures = 0
+        for _ in range(runs):
+            for name, content in (('clipboard', INSERT_CLIPBOARD), ('primary', 'selected'), ('window', '')):
+                (desktop / name).write_text(content)
+            events.write_text('')
+            trace = stats.Trace()
+            start = time.perf_counter()
+            Injector.insert(text, trace)
+            samples['insert'].append((time.perf_counter() - start) * 1000)
+            for phase in ('backup', 'paste'):
+                samples[phase].append(trace.phases.get(phase, 0) * 1000)
+            Injector.wait_restore()
+            restored = ((desktop / 'primary').read_text() == 'selected'
+                        and 'copy-clipboard' not in events.read_text())
+            if trace.meta.get('result') != 'pasted' or (desktop / 'window').read_text() != text or not restored:
+                failures += 1
+        results.append({'scenario': label, 'chars': len(text), 'runs': runs, 'failed': failures,
+                        **{name: statistics.median(values) for name, values in samples.items()},
+                        'max': max(samples['insert'])})
+    return results
+
+# (previous text, next segment's text) -> what stitch() keeps of the latter
+STITCH_CASES = [
+    (('we should ship it on', 'ship it on Monday then'), 'Monday then'),
+    (('the review ends Friday.', 'friday, and then we merge'), 'and then we merge'),
+    (('no overlap here', 'completely new words'), 'completely new words'),
+    (('', 'first segment'), 'first segment'),
+]
+# (file name, sample rate, sample format) of the batch suite's fixtures
+BATCH_FIXTURES = [('pcm16-44k.wav', 44100, 'pcm16'), ('float-22k.wav', 22050, 'float32')]
+
+def write_long_fixture(path: Path, rate: int, sample_format: str, seconds: float) -> None:
+    """
+    Mono WAV of noise bursts (10 s "speech", 4 s pause), written in pieces.
+    float32 gets a hand-made header (format 3), which wave can't write.
+    """
+    import numpy as np
+
+    pattern = np.random.default_rng(0).standard_normal(14 * rate).astype(np.float32) * 0.1
+    pattern[10 * rate:] *= 0.003
+    frames = int(seconds * rate)
+    width = 2 if sample_format == 'pcm16' else 4
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + frames * width, b'WAVE',
+                            b'fmt ', 16, 1 if width == 2 else 3, 1, rate, rate * width, width, width * 8,
+                            b'data', frames * width))
+        written = 0
+        while written < frames:
+            piece = pattern[:frames - written]
+            f.write((piece * 32767).astype('<i2').tobytes() if width == 2 else piece.astype('<f4').tobytes())
+            written += len(piece)
+
+def bench_batch(box: Sandbox, seconds: float = 620) -> List[Dict]:
+    """
+    `whispaste transcribe` on long WAVs at rates other than 16 kHz (PCM16
+    and float32): WavSource.parse, split() covering the file in segments
+    under the upload limit, every segment encoded with auto and opus, and
+    the CLI run against the API stand-in without errors. Plus stitch() on
+    STITCH_CASES.
+    """
+    from whispaste import batch, encoders
+
+    results = []
+    for (previous, text), expected in STITCH_CASES:
+        got = batch.stitch(previous, text)
+        results.append({'check': f"stitch {text!r}", 'ok': got == expected,
+                        'detail': '' if got == expected else f"got {got!r}"})
+
+    stand_in = StandIn(delay=0.05, text='stand-in transcript')
+    env = {**box.env, 'OPENAI_API_KEY': 'stand-in', 'OPENAI_BASE_URL': stand_in.url}
+    try:
+        paths = []
+        for name, rate, sample_format in BATCH_FIXTURES:
+            path = box.root / name
+            write_long_fixture(path, rate, sample_format, seconds)
+            paths.append(path)
+            problems = []
+            source = batch.open_source(path)
+            if not isinstance(source, batch.WavSource) or source.sample_rate != rate or source.frames != int(seconds * rate):
+                problems.append(f"parsed as {type(source).__name__}, {source.sample_rate} Hz, {source.frames} frames")
+            segments = batch.split(source)
+            if segments[0][0] != 0 or segments[-1][1] != source.frames:
+                problems.append("segments don't cover the file")
+            for (_, end, _), (start, _, _) in zip(segments, segments[1:]):
+                if start > end:
+                    problems.append(f"gap at {end / rate:.1f}s")
+            for start, end, _ in segments:
+                if (end - start) * 2 > batch.UPLOAD_LIMIT:
+                    problems.append(f"segment at {start / rate:.0f}s over the upload limit")
+                for encoder in ('auto', 'opus'):
+                    try:
+                        encoders.payload_size(encoders.encode(source.read(start, end), rate, encoder))
+                    except Exception as e:
+                        problems.append(f"{encoder} at {start / rate:.0f}s: {e}")
+            results.append({'check': f"{name} ({len(segments)} segments)", 'ok': not problems,
+                            'detail': '; '.join(problems)})
+
+        run = subprocess.run(box.cli('transcribe', *map(str, paths), '--jsonl'), env=env, cwd=box.root,
+                             capture_output=True, text=True, timeout=300)
+        rows = [json.loads(line) for line in run.stdout.splitlines() if line.startswith('{')]
+        errors = [f"{Path(row['file']).name}: {row['error']}" for row in rows if 'error' in row]
+        ok = run.returncode == 0 and len(rows) == len(paths) and not errors
+        results.append({'check': 'whispaste transcribe', 'ok': ok,
+                        'detail': '; '.join(errors) or ('' if ok else f"exit {run.returncode}: {run.stderr.strip()[-200:]}")})
+    finally:
+        stand_in.close()
+    return results
+
+def bench_memory(box: Sandbox, seconds: float = 3600, rate: int = 16000) -> List[Dict]:
+    """
+    Peak memory (tracemalloc, which sees NumPy's buffers) of a long
+    recording: 20 ms blocks into BlockBuffer, then vad.trim_silence and
+    each available encoder, read through like an upload. Reported as a
+    ratio to the raw int16 samples; copies of the recording show up as +1.
+    """
+    import tracemalloc
+    import numpy as np
+    from whispaste import encoders, vad
+    from whispaste.buffer import BlockBuffer
+
+    # 10 s of "speech" (loud noise) with a 4 s pause, repeated
+    generator = np.random.default_rng(0)
+    pattern = (generator.standard_normal(10 * rate) * 3000).astype(np.int16)
+    pattern[6 * rate:] //= 300
+    block = rate // 50
+    blocks = len(pattern) // block
+
+    tracemalloc.start()
+    try:
+        buffer = BlockBuffer(rate)
+        for index in range(int(seconds * rate) // block):
+            start = index % blocks * block
+            buffer.append(pattern[start:start + block])
+        raw = len(buffer) * 2
+        captured = tracemalloc.get_traced_memory()[1]
+
+        results = []
+        piece = bytearray(1 << 20)
+        for name, encoder in encoders.ENCODERS.items():
+            if not encoder.available():
+                continue
+            tracemalloc.reset_peak()
+            chunks, _ = vad.trim_silence(buffer.chunks(), rate)
+            kept = sum(chunk.nbytes for chunk in chunks)
+            upload = encoder.encode(chunks, rate)
+            size = 0
+            while True:
+                n = upload.readinto(piece)
+                if not n:
+                    break
+                size += n
+            del chunks, upload
+            peak = tracemalloc.get_traced_memory()[1]
+            results.append({'encoder': name, 'seconds': len(buffer) / rate, 'raw_mib': raw / 2**20,
+                            'buffer_mib': buffer.nbytes / 2**20, 'captured_mib': captured / 2**20,
+                            'kept_mib': kept / 2**20, 'upload_mib': size / 2**20,
+                            'peak_mib': peak / 2**20, 'ratio': max(peak, captured) / raw})
+    finally:
+        tracemalloc.stop()
+    return results
+
+def make_certificate(box: Sandbox) -> Optional[Path]:
+    """Self-signed certificate for 127.0.0.1 (cert and key in one file); None without openssl."""
+    path = box.root / 'stand-in.pem'
+    if not path.exists():
+        key = box.root / 'stand-in.key'
+        try:
+            subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                            '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                            '-keyout', str(key), '-out', str(path)],
+                           check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        path.write_text(path.read_text() + key.read_text())
+    return path
+
+# (label, preconnect while recording) compared by the preconnect suite
+PRECONNECT_SCENARIOS = [('cold', False), ('preconnect', True)]
+
+def bench_preconnect(box: Sandbox, runs: int = 5, recording: float = 0.5, connect_delay: float = 0.15) -> List[Dict]:
+    """
+    Upload latency right after a recording of recording seconds, with and
+    without AudioEngine.preconnect() during it, against an HTTPS stand-in
+    whose handshakes take connect_delay. With preconnect the upload must
+    reuse the warm connection: no handshake after the recording.
+    (Plain HTTP, counting TCP connections, when openssl is missing.)
+    """
+    import numpy as np
+    from openai import OpenAI, DefaultHttpxClient
+    from whispaste import encoders, stats, transcribers
+    from whispaste.audio import AudioEngine
+
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    os.environ.update({'WHISPASTE_RETRIES': '0', 'WHISPASTE_HEDGE': 'off'})
+    certificate = make_certificate(box)
+    tls, verify = None, True
+    if certificate is not None:
+        tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        tls.load_cert_chain(certificate)
+        verify = ssl.create_default_context(cafile=str(certificate))
+    payload = encoders.encode(np.zeros(16000, dtype=np.int16), 16000, 'wav')
+
+    results = []
+    for label, preconnect in PRECONNECT_SCENARIOS:
+        samples, handshakes, total = [], [], 0
+        for _ in range(runs):
+            stand_in = StandIn(delay=0.05, tls=tls, connect_delay=connect_delay)
+            # Like AudioEngine.get_client(), but trusting the stand-in's certificate
+            engine = AudioEngine()
+            engine.http = DefaultHttpxClient(verify=verify)
+            engine.client = OpenAI(api_key='stand-in', base_url=stand_in.url, http_client=engine.http, max_retries=0)
+            transcriber = transcribers.OpenAITranscriber(lambda: engine.client)
+            stop = threading.Event()
+            try:
+                if preconnect:
+                    engine.preconnect(stop)
+                time.sleep(recording)
+                before = stand_in.connections
+                start = time.perf_counter()
+                transcriber.transcribe(payload, 16000)
+                samples.append((time.perf_counter() - start) * 1000)
+                handshakes.append(stand_in.connections - before)
+                total += stand_in.connections
+            finally:
+                stop.set()
+                engine.http.close()
+                stand_in.close()
+        results.append({'scenario': label, 'protocol': 'https' if tls else 'http', 'runs': runs,
+                        'handshakes': total, 'upload_handshakes': sum(handshakes),
+                        'p50': stats.percentile(samples, 50), 'max': max(samples),
+                        'ok': not preconnect or sum(handshakes) == 0})
+    return results
+
+# (label, stall one run) compared by the typing suite, after the single call
+TYPING_SCENARIOS = [('chunked', False), ('chunked + stall', True)]
+
+def bench_typing(box: Sandbox, chars: int = 600) -> List[Dict]:
+    """
+    Characters per second typed into the fake xdotool, and whether the text
+    arrived complete and in order. After a stall, what the stalled run had
+    typed is typed again; more than that (a repeat longer than one typer
+    chunk, or anywhere but where the run stalled) fails the run.
+    """
+    from whispaste import backends, typer
+
+    bin_dir = box.root / 'bin'
+    bin_dir.mkdir(exist_ok=True)
+    tool = bin_dir / 'xdotool'
+    tool.write_text(FAKE_XDOTOOL)
+    tool.chmod(0o755)
+    typed, stall = box.root / 'typed', box.root / 'stall'
+    os.environ.update({'XDG_CONFIG_HOME': box.env['XDG_CONFIG_HOME'], 'DISPLAY': ':bench',
+                       'PATH': os.pathsep.join([str(bin_dir), os.environ.get('PATH', '')]),
+                       'WHISPASTE_BENCH_TYPED': str(typed), 'WHISPASTE_BENCH_STALL': str(stall)})
+    os.environ.pop('WAYLAND_DISPLAY', None)
+    backends.invalidate()
+
+    words = random.Random(0).choices(['the', 'quick', 'brown', 'fox', 'jumps', 'over', 'a', 'lazy', 'dog,'], k=chars)
+    text = ' '.join(words)[:chars]
+
+    def single():
+        # What type_string did before typer.py: everything in one run, 5 s timeout
+        try:
+            subprocess.run([shutil.which('xdotool'), 'type', '--clearmodifiers', '--', text],
+                           timeout=5, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            return True
+        except subprocess.SubprocessError:
+            return False
+
+    results = []
+    for label, stalls in [('single call', False)] + TYPING_SCENARIOS:
+        typed.write_text('')
+        if stalls:
+            stall.write_text('1')
+        start = time.perf_counter()
+        ok = single() if label == 'single call' else typer.type_text(text)
+        seconds = time.perf_counter() - start
+        stall.unlink(missing_ok=True)
+        out = typed.read_text()
+        repeat = len(out) - len(text)
+        # out is text with out[k - repeat:k] typed twice, for some k
+        complete = 0 <= repeat <= (typer.CHUNK if stalls else 0) and any(
+            out[:k] == text[:k] and out[k:] == text[k - repeat:] for k in range(repeat, len(text) + 1))
+        results.append({'scenario': label, 'ok': ok and complete, 'seconds': seconds,
+                        'cps': len(out) / seconds, 'typed': len(out), 'chars': len(text),
+                        'repeated': max(0, len(out) - len(text))})
+    return results
+
+# Typical short dictations; the last two are routed to the model (no sentence end, long)
+CLEANUP_SAMPLES = [
+    "Um, can you send me the numbers for Q3 by Friday?",
+    "So uh I think we should deploy on Monday.",
+    "i'll be there in, um, ten minutes.",
+    "Hmm, let's move the standup to 10:30 tomorrow.",
+    "Thanks, uh, that looks good to me. Ship it!",
+    "Uh, the build is failing again. Can you take a look?",
+    "okay so the plan is we refactor the parser first and then uh we look at the cache after lunch",
+    " ".join(["Uh, we talked about the roadmap and the hiring plan and the budget."] * 8),
+]
+
+# (transcript, what the local pass must make of it), checked by the cleanup suite
+CLEANUP_EXPECTED = [(text, cleaned) for text, cleaned in zip(CLEANUP_SAMPLES, [
+    "Can you send me the numbers for Q3 by Friday?",
+    "So I think we should deploy on Monday.",
+    "I'll be there in ten minutes.",
+    "Let's move the standup to 10:30 tomorrow.",
+    "Thanks, that looks good to me. Ship it!",
+    "The build is failing again. Can you take a look?",
+])] + [
+    ("Um.", ""),
+    ("um, uh, hmm", ""),
+    ("Okay. Uh. Let's go.", "Okay. Let's go."),
+    ("we saw an ER doctor", "We saw an ER doctor."),
+    ("the screw is 5 mm long", "The screw is 5 mm long."),
+    ("use a tool, i.e. a hammer", "Use a tool, i.e. a hammer."),
+    ("e.g. the cache is cold", "e.g. the cache is cold."),
+    ("mm-hmm that works", "Mm-hmm that works."),
+    ("uh-oh, the build broke", "Uh-oh, the build broke."),
+    ("a well-known um state-of-the-art fix", "A well-known state-of-the-art fix."),
+    ("i think i can", "I think I can."),
+]
+
+def bench_cleanup(box: Sandbox, rounds: int = 3, chat_delay: float = 0.4) -> List[Dict]:
+    """
+    Per-transcript latency of the cleanup template: always via the chat
+    model, and local first (the model only when cleanup.needs_llm says so).
+    The first row checks the local pass against CLEANUP_EXPECTED.
+    """
+    from openai import OpenAI
+    from whispaste import cleanup, stats
+    from whispaste.audio import AudioEngine
+
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    os.environ.update({'WHISPASTE_CLEANUP_LLM': 'auto', 'WHISPASTE_HEDGE': 'off'})
+    prompt = 'Clean up this transcribed speech.'
+    stand_in = StandIn(delay=chat_delay, text='Cleaned text.')
+    engine = AudioEngine()
+    engine.client = OpenAI(api_key='stand-in', base_url=stand_in.url, max_retries=0)
+
+    def local(text):
+        text, rest = cleanup.apply(text, prompt)
+        return engine.refine(text, rest, notify=False) if rest else text
+
+    wrong = [(text, cleanup.clean(text), cleaned) for text, cleaned in CLEANUP_EXPECTED
+             if cleanup.clean(text) != cleaned]
+    results = [{'path': 'expected output', 'checked': len(CLEANUP_EXPECTED), 'wrong': wrong}]
+    try:
+        for label, path in [('model', lambda text: engine.refine(text, prompt, notify=False)), ('local first', local)]:
+            samples = []
+            before = stand_in.requests
+            for _ in range(rounds):
+                for text in CLEANUP_SAMPLES:
+                    start = time.perf_counter()
+                    path(text)
+                    samples.append((time.perf_counter() - start) * 1000)
+            results.append({'path': label, 'calls': len(samples), 'model_calls': stand_in.requests - before,
+                            **{f'p{p}': stats.percentile(samples, p) for p in (50, 95)},
+                            'mean': statistics.mean(samples)})
+        # The local pass alone, without the stand-in
+        text = CLEANUP_SAMPLES[1]
+        start = time.perf_counter()
+        for _ in range(1000):
+            cleanup.clean(text)
+        results.append({'path': 'local pass only', 'us': (time.perf_counter() - start) * 1000})
+    finally:
+        stand_in.close()
+    return results
+
+# (label, debounce ms, presses per second, seconds) compared by the toggle suite
+TOGGLE_SCENARIOS = [('debounced', 250, 400, 2.0), ('no debounce', 0, 200, 1.0)]
+
+def bench_toggle(box: Sandbox, threads: int = 4) -> List[Dict]:
+    """
+    Presses from threads at once (each its own flock, like separate CLI
+    processes) against fake workers; overlapping captures and workers
+    still alive after the last stop are errors.
+    """
+    from whispaste import toggle
+
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    results = []
+    for label, debounce_ms, rate, seconds in TOGGLE_SCENARIOS:
+        box.clear()
+        log = box.root / 'captures'
+        log.write_text('')
+        os.environ['WHISPASTE_DEBOUNCE_MS'] = str(debounce_ms)
+        workers: List[subprocess.Popen] = []
+        outcomes: Dict[str, int] = {}
+        latencies: List[float] = []
+        lock = threading.Lock()
+
+        def spawn() -> int:
+            worker = subprocess.Popen([sys.executable, '-c', FAKE_TOGGLE_WORKER, str(log)],
+                                      env={**box.env, toggle.SPAWNED: '1'}, cwd=box.root)
+            workers.append(worker)
+            return worker.pid
+
+        def fire(count: int, interval: float):
+            next_press = time.monotonic()
+            for _ in range(count):
+                start = time.perf_counter()
+                outcome = toggle.press(spawn, {})
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                next_press += interval
+                time.sleep(max(0, next_press - time.monotonic()))
+
+        per_thread = int(rate * seconds / threads)
+        pressers = [threading.Thread(target=fire, args=(per_thread, threads / rate)) for _ in range(threads)]
+        for presser in pressers:
+            presser.start()
+        for presser in pressers:
+            presser.join()
+
+        # Stop whatever is still recording, then let every worker finish
+        time.sleep(debounce_ms / 1000)
+        if toggle.read_state().get('state') == 'recording':
+            toggle.press(spawn, {})
+        leftover = 0
+        for worker in workers:
+            try:
+                worker.wait(15)
+            except subprocess.TimeoutExpired:
+                leftover += 1
+                worker.kill()
+                worker.wait()
+
+        captures = sorted(tuple(map(float, line.split()[1:])) for line in log.read_text().splitlines())
+        overlaps = sum(1 for a, b in zip(captures, captures[1:]) if b[0] < a[1])
+        results.append({'scenario': label, 'presses': sum(outcomes.values()), **outcomes,
+                        'workers': len(workers), 'captures': len(captures), 'overlaps': overlaps,
+                        'leftover': leftover, 'final': toggle.read_state().get('state'),
+                        'p50': stats_percentile(latencies, 50), 'p99': stats_percentile(latencies, 99)})
+    return results
+
+# What the e2e stand-in answers, and what the fake clipboard holds beforehand
+E2E_TRANSCRIPT = 'send the quarterly numbers by friday'
+E2E_REFINED = 'Please send the quarterly numbers by Friday.'
+E2E_CLIPBOARD = 'copied before the hotkey'
+# Stand-in latency in seconds: transcription, chat completion, between streamed words
+E2E_API = {'transcribe': 0.3, 'chat': 0.2, 'token': 0.02}
+# (label, CLI arguments) compared by the e2e suite; all but auto-stop end with a second press
+E2E_SCENARIOS = [
+    ('paste', []),
+    ('prompt, streamed', ['-p', 'Fix the grammar.']),
+    ('clipboard', ['-c']),
+    ('auto-stop', ['-a', '0.5']),
+]
+
+# Columns of the e2e table: stats.jsonl phases, then what the harness measures itself
+E2E_COLUMNS = ['hotkey', 'encode', 'transcribe', 'refine', 'backup', 'paste', 'restore', 'latency', 'overhead', 'press']
+
+def write_fixture(path: Path, speech: float = 1.5, rate: int = 16000) -> float:
+    """
+    Synthetic dictation as a WAV file: 0.3 s of silence, speech-like
+    syllables (voiced harmonics, 180 ms each), 0.5 s of silence.
+    Returns its duration in seconds.
+    """
+    import wave
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    syllable = np.arange(int(0.18 * rate)) / rate
+    pieces = [np.zeros(int(0.3 * rate))]
+    while sum(map(len, pieces)) < (0.3 + speech) * rate:
+        pitch = rng.uniform(110, 180)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * syllable) / k for k in range(1, 6))
+        pieces.append(0.2 * np.hanning(len(syllable)) * voiced + 0.005 * rng.standard_normal(len(syllable)))
+        pieces.append(np.zeros(int(0.07 * rate)))
+    pieces.append(np.zeros(int(0.5 * rate)))
+    samples = np.clip(np.concatenate(pieces) * 32767, -32768, 32767).astype(np.int16)
+    with wave.open(str(path), 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(samples.tobytes())
+    return len(samples) / rate
+
+def wav_duration(path: Path) -> float:
+    import wave
+    with wave.open(str(path)) as f:
+        return f.getnframes() / f.getframerate()
+
+def bench_e2e(box: Sandbox, runs: int = 3, wav: Optional[Path] = None) -> List[Dict]:
+    """
+    Hotkey to text in the window, through the real CLI and worker: the fake
+    sounddevice replays wav in real time, the API is a StandIn (E2E_API),
+    and fake wl-copy/wl-paste/wtype stand in for the desktop. Per-phase
+    medians come from the worker's stats.jsonl records, plus:
+    - overhead: latency minus transcribe and refine, i.e. what whispaste
+      adds on top of the API (streamed post-processing counts its pastes as refine)
+    - press:    second CLI press -> text pasted/copied, as the harness sees it
+    A run fails if the text isn't what it should be, or a paste run touches
+    the clipboard.
+    """
+    from whispaste import stats
+
+    bin_dir = box.root / 'bin'
+    bin_dir.mkdir(exist_ok=True)
+    for tool in ('wl-copy', 'wl-paste', 'wtype'):
+        (bin_dir / tool).write_text(FAKE_DESKTOP)
+        (bin_dir / tool).chmod(0o755)
+    # Like the installed console script: the CLI starts the worker as sys.argv[0]
+    cli = bin_dir / 'whispaste'
+    cli.write_text(f"#!{sys.executable}\nfrom whispaste.__main__ import main\nmain()\n")
+    cli.chmod(0o755)
+    desktop, events, stamp = box.root / 'desktop', box.root / 'events', box.config / 'stamp'
+    desktop.mkdir(exist_ok=True)
+    if wav is None:
+        wav = box.root / 'fixture.wav'
+        write_fixture(wav)
+    duration = wav_duration(wav)
+
+    stand_in = StandIn(delay=E2E_API['transcribe'], text=E2E_TRANSCRIPT, chat_delay=E2E_API['chat'],
+                       chat_text=E2E_REFINED, token_delay=E2E_API['token'])
+    os.environ['XDG_CONFIG_HOME'] = box.env['XDG_CONFIG_HOME']
+    env = {**box.env,
+           'PATH': os.pathsep.join([str(bin_dir), box.env.get('PATH', '')]),
+           'WAYLAND_DISPLAY': 'bench', 'OPENAI_API_KEY': 'stand-in', 'OPENAI_BASE_URL': stand_in.url,
+           'WHISPASTE_BENCH_WAV': str(wav), 'WHISPASTE_BENCH_STAMP': str(stamp),
+           'WHISPASTE_BENCH_EVENTS': str(events), 'WHISPASTE_BENCH_DESKTOP': str(desktop)}
+
+    def press(args):
+        subprocess.run([str(cli), *args], env=env, cwd=box.root, timeout=10,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def next_record(seen: int) -> Dict:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            records = stats.load()
+            if len(records) > seen:
+                return records[-1]
+            time.sleep(0.02)
+        raise TimeoutError("the worker never wrote its stats record")
+
+    results = []
+    try:
+        for label, args in E2E_SCENARIOS:
+            clipboard = '-c' in args
+            expected = E2E_REFINED if '-p' in args else E2E_TRANSCRIPT
+            samples: Dict[str, List[float]] = {}
+            failures = 0
+            for _ in range(runs):
+                box.clear()
+                # The same audio again would come from the transcript cache
+                shutil.rmtree(box.config / 'spool', ignore_errors=True)
+                for name, text in (('clipboard', E2E_CLIPBOARD), ('primary', ''), ('window', '')):
+                    (desktop / name).write_text(text)
+                events.write_text('')
+                seen = len(stats.load())
+
+                press(args)
+                first_block = wait_for(stamp)
+                stopped = None
+                if '-a' not in args:
+                    time.sleep(max(0.0, first_block + duration - time.time()))
+                    stopped = time.time()
+                    press(args)
+                record = next_record(seen)
+
+                delivered = [float(line.split()[0]) for line in events.read_text().splitlines()
+                             if line.split()[2] in (('copy-clipboard',) if clipboard else ('paste', 'type'))]
+                text = (desktop / ('clipboard' if clipboard else 'window')).read_text()
+                restored = clipboard or 'copy-clipboard' not in events.read_text()
+                if text != expected or not restored or not delivered:
+                    failures += 1
+                    continue
+
+                ms = dict(record.get('ms', {}))
+                ms['overhead'] = ms.get('latency', 0) - ms.get('transcribe', 0) - ms.get('refine', 0)
+                if stopped is not None:
+                    ms['press'] = (delivered[0] - stopped) * 1000
+                for phase, value in ms.items():
+                    samples.setdefault(phase, []).append(value)
+            results.append({'scenario': label, 'runs': runs, 'failed': failures,
+                            **{phase: statistics.median(values) for phase, values in samples.items()}})
+    finally:
+        stand_in.close()
+    return results
+
+def stats_percentile(values: List[float], p: float) -> float:
+    from whispaste import stats
+    return stats.percentile(values, p) if values else float('nan')
+
+def startup(box: Sandbox, args) -> List[str]:
+    """Run the cold-start benchmarks; returns the names over budget."""
+    failed = []
+    for name, bench in BENCHMARKS.items():
+        samples = [bench(box) * 1000 for _ in range(args.runs)]
+        median = statistics.median(samples)
+        budget = getattr(args, f'budget_{name}')
+        verdict = 'ok' if median <= budget else 'OVER'
+        if median > budget:
+            failed.append(name)
+        print(f"{name:>8}: median {median:6.1f} ms  min {min(samples):6.1f}  max {max(samples):6.1f}  "
+              f"budget {budget:.0f} ms  {verdict}")
+
+    print("\nimport time (cumulative, ms):")
+    for row in import_times(box):
+        print(f"  {row['cumulative']:7.1f}  {row['self']:6.1f}  {'  ' * row['depth']}{row['module']}")
+    return failed
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency benchmarks for whispaste")
+    parser.add_argument('suites', nargs='*', metavar='SUITE', help='startup (default), api, preconnect, batch, insert, memory, listen, typing, cleanup, toggle and/or e2e')
+    parser.add_argument('-n', '--runs', type=int, default=5)
+    parser.add_argument('--wav', type=Path, metavar='FILE', help='e2e: recording to replay (default: synthetic speech)')
+    for name, budget in BUDGETS.items():
+        parser.add_argument(f'--budget-{name}', type=float, default=budget, metavar='MS',
+                            help=f'Budget for the {name} path (default: {budget} ms)')
+    for name, budget in E2E_BUDGETS.items():
+        parser.add_argument(f'--budget-{name}', type=float, default=budget, metavar='MS',
+                            help=f'e2e budget for the {name} phase (default: {budget} ms)')
+    parser.add_argument('--budget-insert', type=float, default=INSERT_BUDGET, metavar='MS',
+                        help=f'Budget for Injector.insert() (default: {INSERT_BUDGET} ms)')
+    parser.add_argument('--budget-memory', type=float, default=MEMORY_BUDGET, metavar='RATIO',
+                        help=f'Peak memory of an hour of audio over its raw samples (default: {MEMORY_BUDGET})')
+    args = parser.parse_args()
+    suites = args.suites or ['startup']
+    for suite in suites:
+        if suite not in ('startup', 'api', 'preconnect', 'batch', 'insert', 'memory', 'listen', 'typing', 'cleanup', 'toggle', 'e2e'):
+            parser.error(f"unknown suite: {suite}")
+
+    box = Sandbox()
+    failed = []
+    try:
+        if 'startup' in suites:
+            failed = startup(box, args)
+        if 'api' in suites:
+            print(f"\n{'api':>16}{'ok':>6}{'failed':>8}{'requests':>10}{'p50':>8}{'p95':>8}{'p99':>8}  ms")
+            for row in bench_api(box):
+                print(f"{row['scenario']:>16}{row['ok']:>6}{row['failed']:>8}{row['requests']:>10}"
+                      + ''.join(f"{row.get(f'p{p}', float('nan')):>8.0f}" for p in (50, 95, 99)))
+        if 'preconnect' in suites:
+            print(f"\n{'preconnect':>16}{'protocol':>10}{'handshakes':>12}{'in upload':>11}{'p50':>8}{'max':>8}  ms")
+            for row in bench_preconnect(box, args.runs):
+                print(f"{row['scenario']:>16}{row['protocol']:>10}{row['handshakes']:>12}"
+                      f"{row['upload_handshakes']:>11}{row['p50']:>8.0f}{row['max']:>8.0f}")
+                if not row['ok']:
+                    failed.append(f"preconnect ({row['upload_handshakes']} handshakes in the upload)")
+        if 'batch' in suites:
+            print()
+            for row in bench_batch(box):
+                print(f"{'ok' if row['ok'] else 'FAIL':>6}  {row['check']}" + (f": {row['detail']}" if row['detail'] else ''))
+                if not row['ok']:
+                    failed.append(f"batch ({row['check']})")
+        if 'insert' in suites:
+            print(f"\n{'insert':>10}{'chars':>7}{'ok':>6}{'insert':>8}{'backup':>8}{'paste':>8}{'max':>8}  ms (median)")
+            for row in bench_insert(box, args.runs):
+                print(f"{row['scenario']:>10}{row['chars']:>7}{row['runs'] - row['failed']:>3}/{row['runs']:<2}"
+                      + ''.join(f"{row[column]:>8.1f}" for column in ('insert', 'backup', 'paste', 'max')))
+                if row['failed'] or row['insert'] > args.budget_insert:
+                    failed.append(f"insert ({row['scenario']}: {'wrong text' if row['failed'] else 'over budget'})")
+        if 'memory' in suites:
+            print(f"\n{'memory':>8}{'audio':>8}{'raw':>8}{'buffer':>8}{'kept':>8}{'upload':>8}{'peak':>8}{'ratio':>7}  MiB")
+            for row in bench_memory(box):
+                print(f"{row['encoder']:>8}{row['seconds'] / 60:>6.0f} m" + ''.join(
+                    f"{row[f'{column}_mib']:>8.1f}" for column in ('raw', 'buffer', 'kept', 'upload', 'peak'))
+                      + f"{row['ratio']:>7.2f}")
+                if row['ratio'] > args.budget_memory:
+                    failed.append(f"memory ({row['encoder']}: {row['ratio']:.2f}x the samples)")
+        if 'listen' in suites:
+            print()
+            for row in bench_listen(box):
+                cpu = row['idle_cpu_percent']
+                print(f"preroll {row['preroll_ms']:>4} ms: idle CPU {'n/a' if cpu is None else f'{cpu:.2f}%'}"
+                      + (f"  ring {row['listening']['ring_bytes']} B, {row['listening']['callback_us']} us/callback"
+                         if row['listening'] else ''))
+        if 'typing' in suites:
+            print(f"\n{'typing':>16}{'ok':>6}{'typed':>12}{'repeated':>10}{'seconds':>9}{'chars/s':>9}")
+            for row in bench_typing(box):
+                print(f"{row['scenario']:>16}{'yes' if row['ok'] else 'no':>6}{row['typed']:>6}/{row['chars']:<5}"
+                      f"{row['repeated']:>10}{row['seconds']:>9.1f}{row['cps']:>9.0f}")
+                if not row['ok'] and row['scenario'] != 'single call':  # The old fallback, for comparison
+                    failed.append(f"typing ({row['scenario']})")
+        if 'cleanup' in suites:
+            print(f"\n{'cleanup':>16}{'calls':>7}{'to model':>10}{'p50':>8}{'p95':>8}{'mean':>8}  ms")
+            for row in bench_cleanup(box):
+                if 'wrong' in row:
+                    print(f"{row['path']:>16}: {row['checked'] - len(row['wrong'])}/{row['checked']} transcripts")
+                    for text, got, cleaned in row['wrong']:
+                        print(f"{'':>18}{text!r} -> {got!r}, expected {cleaned!r}")
+                    if row['wrong']:
+                        failed.append(f"cleanup ({len(row['wrong'])} wrong outputs)")
+                    continue
+                if 'us' in row:
+                    print(f"{row['path']:>16}: {row['us']:.0f} us per transcript")
+                    continue
+                print(f"{row['path']:>16}{row['calls']:>7}{row['model_calls']:>10}"
+                      f"{row['p50']:>8.1f}{row['p95']:>8.1f}{row['mean']:>8.1f}")
+        if 'toggle' in suites:
+            print(f"\n{'toggle':>12}{'presses':>9}{'started':>9}{'stopped':>9}{'ignored':>9}"
+                  f"{'overlaps':>10}{'leftover':>10}{'p50':>7}{'p99':>7}  ms")
+            for row in bench_toggle(box):
+                print(f"{row['scenario']:>12}{row['presses']:>9}{row.get('start', 0):>9}{row.get('stop', 0):>9}"
+                      f"{row.get('debounced', 0):>9}{row['overlaps']:>10}{row['leftover']:>10}"
+                      f"{row['p50']:>7.2f}{row['p99']:>7.2f}  (final state: {row['final']})")
+                if row['overlaps'] or row['leftover']:
+                    failed.append(f"toggle ({row['scenario']})")
+        if 'e2e' in suites:
+            print(f"\n{'e2e':>16}{'ok':>6}" + ''.join(f"{column:>11}" for column in E2E_COLUMNS) + '  ms (median)')
+            for row in bench_e2e(box, args.runs, args.wav):
+                print(f"{row['scenario']:>16}{row['runs'] - row['failed']:>3}/{row['runs']:<2}"
+                      + ''.join(f"{row[column]:>11.1f}" if column in row else f"{'-':>11}" for column in E2E_COLUMNS))
+                over = [name for name in E2E_BUDGETS if row.get(name, 0) > getattr(args, f'budget_{name}')]
+                if row['failed'] or over:
+                    failed.append(f"e2e ({row['scenario']}: {', '.join(over) or 'wrong text'})")
+    finally:
+        box.close()
+
+    if failed:
+        print(f"\nOver budget: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -5,14 +5,16 @@ CLI Entry Point & Daemon Logic.
 import sys
 import os
 import signal
-import json
+import time
 import argparse
 import subprocess
+import threading
 from .config import CONFIG
 from .system import System
-from .audio import AudioEngine
-from .clipboard import Clipboard
-from .injector import Injector
+from . import control
+from . import toggle
+from . import encoders
+from . import transcribers
 
 TEMPLATES = {
     'cleanup': 'Clean up this transcribed speech. Fix grammar, punctuation, and remove filler words. Keep original meaning. Output only cleaned text.',
@@ -25,63 +27,86 @@ def worker_loop():
     Optimized worker with instant recording start.
     Pre-warms audio system then records immediately.
     """
-    # 1. Setup PID
-    CONFIG.pid_file.write_text(str(os.getpid()))
-    
-    should_stop = False
-    def stop_signal_handler(signum, frame):
-        nonlocal should_stop
-        should_stop = True
-        
-    signal.signal(signal.SIGTERM, stop_signal_handler)
-    signal.signal(signal.SIGINT, stop_signal_handler)
+    # 0. SIGTERM/SIGINT (the second toggle) end the recording. Set up first,
+    # so a press that comes while we start up isn't lost.
+    stop = stop_on_signals()
+
+    # 1. Claim the recorder slot (and the options the CLI left with it);
+    # a press that came before we got here may already have stopped us
+    try:
+        opts = toggle.register()
+    except OSError as e:
+        System.log(f"Toggle: {e}")
+        return
+    if opts is None:
+        toggle.finished()
+        return
+
+    # Only the worker needs the audio/session stack; the toggle path
+    # (manage_daemon_state) stays on the light imports above.
+    from .audio import AudioEngine
+    from .session import Session
     
     try:
         # 2. Start recording IMMEDIATELY - no pre-warming delay
-        System.notify("Listening...")
         engine = AudioEngine()  # Lightweight, no pre-warming
-        audio = engine.record_until_stop(lambda: should_stop)
+        session = Session(engine, opts)
+        session.record(stop)
+
+        # 3. Capture is over: let the next toggle start a new worker while
+        # this one transcribes (delivery stays in order, see pipeline.py)
+        toggle.captured()
         
         # 4. Transcribe & Action
-        if audio is not None:
-            # Reload opts (passed from the CLI trigger)
-            opts = CONFIG.get_opts()
-            
-            text = engine.transcribe(
-                audio, 
-                post_prompt=opts.get('prompt'),
-                post_model=opts.get('model')
-            )
-            
-            if text:
-                if opts.get('clipboard', False):
-                    if Clipboard.write(text):
-                        System.notify("Copied to clipboard!")
-                    else:
-                        System.notify("Failed to copy.")
-                else:
-                    Injector.insert(text)
-        else:
-            System.notify("No audio recorded.")
+        session.process()
             
     except Exception as e:
         System.notify(f"Critical Error: {e}")
         System.log(str(e))
     finally:
-        CONFIG.cleanup()
+        toggle.finished()
 
-def start_daemon(args):
-    """Spawn the worker process in the background."""
-    import os
-    
-    # Save options for the worker to read
-    opts = {
+def stop_on_signals() -> threading.Event:
+    """
+    An event that SIGTERM/SIGINT set, so the recorder can simply wait on it.
+    A plain handler rather than blocking the signals: the mask would be
+    inherited by wl-copy/xclip and friends, which then ignore SIGTERM.
+    The handler itself can't set the event: it runs in the main thread,
+    possibly inside Event.wait() holding the event's (non-reentrant) lock.
+    Instead the signal wakes up a pipe (set_wakeup_fd) and a helper thread
+    sets the event.
+    """
+    stop = threading.Event()
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(write_fd, False)
+    signal.set_wakeup_fd(write_fd)
+
+    def relay():
+        os.read(read_fd, 1)
+        stop.set()
+
+    threading.Thread(target=relay, name='signals', daemon=True).start()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: None)
+    return stop
+
+def get_session_opts(args):
+    """Options the worker (or resident daemon) needs for one session."""
+    return {
         'clipboard': args.clipboard,
         'prompt': args.prompt,
-        'model': args.model
+        'template': args.template,
+        'model': args.model,
+        'stream': args.stream,
+        'vad': not args.no_vad,
+        'encoder': args.encoder,
+        'backend': args.backend,
+        'auto_stop': args.auto_stop,
+        'invoked': time.time()  # Start of the hotkey -> capture span (stats.py)
     }
-    CONFIG.save_opts(opts)
-    
+
+def start_daemon() -> int:
+    """Spawn the worker process in the background; returns its PID."""
     # Launch the worker package as a detached subprocess
     # Use sys.argv[0] to preserve the wrapped executable path in Nix
     executable = sys.argv[0]  # This will be the whispaste wrapper, not bare python
@@ -91,52 +116,56 @@ def start_daemon(args):
     env = os.environ.copy()
     # Add current sys.path to PYTHONPATH to ensure daemon has same Python path
     env['PYTHONPATH'] = ':'.join(sys.path)
+    env[toggle.SPAWNED] = '1'  # Only takes the recorder slot this press gives it
     
-    subprocess.Popen(
+    return subprocess.Popen(
         [executable, '--daemon'],
         start_new_session=True,
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
         stdin=subprocess.DEVNULL,
         env=env  # Pass environment with full Python path
-    )
-
-def stop_daemon(pid):
-    """Signal the existing worker process to stop recording and process."""
-    System.kill(pid)  # Sends SIGTERM
+    ).pid
 
 def manage_daemon_state(args):
     """
     CLI Controller Logic:
-    - If running -> Stop it (Process audio).
-    - If stopped -> Start it (Begin recording).
+    - If recording -> Stop it (Process audio).
+    - Otherwise -> Start a worker (Begin recording).
+    A resident daemon (--serve) is preferred when one is listening.
+    The decision is made under the toggle lock (see toggle.py), and presses
+    right after another one are ignored.
     """
-    pid_file = CONFIG.pid_file
-    
-    # Check for existing process
-    if pid_file.exists():
-        try:
-            pid = int(pid_file.read_text().strip())
-            if System.is_running(pid):
-                stop_daemon(pid)
-                return
-        except Exception:
-            pass
-        # PID file exists but process is dead (stale)
-        pid_file.unlink(missing_ok=True)
-
-    # If we get here, no valid daemon is running
-    start_daemon(args)
+    if control.send_command('toggle', opts=get_session_opts(args)) is not None:
+        return
+
+    if toggle.press(start_daemon, get_session_opts(args)) == 'debounced':
+        System.log("Toggle: ignored a press right after the last one")
 
 def main():
     parser = argparse.ArgumentParser(description="Whispaste: Voice-to-Paste")
+    parser.add_argument('command', nargs='?', choices=['stats', 'transcribe'],
+                        help='stats: latency per phase (p50/p95/p99) from recorded sessions; transcribe: audio files')
+    parser.add_argument('files', nargs='*', metavar='FILE', help='Audio files (WAV, FLAC...) for transcribe')
     # --daemon is an internal flag used by the worker process
     parser.add_argument('--daemon', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--serve', action='store_true', help='Run a resident daemon that keeps audio and API warm between toggles')
+    parser.add_argument('--preroll', type=int, metavar='MS', help='With --serve: keep the microphone open and prepend the last MS milliseconds to each recording (default: $WHISPASTE_PREROLL_MS or off)')
     
     parser.add_argument('-c', '--clipboard', action='store_true', help='Copy to clipboard only, do not type')
     parser.add_argument('-p', '--prompt', help='Post-processing prompt')
     parser.add_argument('-m', '--model', help='Post-processing model (default: gpt-4o-mini)')
+    parser.add_argument('-s', '--stream', action='store_true', help='Transcribe in segments while still recording (faster for long dictation)')
+    parser.add_argument('--no-vad', action='store_true', help='Upload everything, including silence')
+    parser.add_argument('-a', '--auto-stop', type=float, nargs='?', const=1.0, metavar='SECONDS', help='Stop by itself after this much silence once you have spoken (default: 1.0)')
+    parser.add_argument('-e', '--encoder', choices=encoders.CHOICES, default='auto', help='Upload format (default: auto, by recording length)')
+    parser.add_argument('-b', '--backend', choices=transcribers.BACKENDS, help='Transcription backend (default: $WHISPASTE_BACKEND or openai)')
     parser.add_argument('-t', '--template', choices=TEMPLATES.keys(), help='Use a preset prompt template')
+    parser.add_argument('--since', default='7d', help='Time window for stats, e.g. 24h, 7d (default: 7d)')
+    parser.add_argument('-j', '--jobs', type=int, default=4, help='Segments transcribed at once by transcribe (default: 4)')
+    parser.add_argument('--retry-last', action='store_true', help='Transcribe and insert the last recording again, with its original options')
+    parser.add_argument('--reprocess-last', action='store_true', help='Process the last recording again with the options given now, e.g. -t email (the transcript is reused)')
+    parser.add_argument('--jsonl', action='store_true', help='transcribe: one JSON object per file instead of plain text')
 
 
     args = parser.parse_args()
@@ -145,7 +174,23 @@ def main():
     if args.template:
         args.prompt = TEMPLATES[args.template]
 
-    if args.daemon:
+    if args.command == 'transcribe':
+        if not args.files:
+            parser.error("transcribe needs at least one FILE")
+        from . import batch
+        sys.exit(batch.run(args.files, get_session_opts(args), args.jobs, args.jsonl))
+    elif args.command == 'stats':
+        from . import stats
+        print(stats.report(args.since))
+    elif args.retry_last or args.reprocess_last:
+        from . import spool
+        sys.exit(spool.reprocess(get_session_opts(args) if args.reprocess_last else None))
+    elif args.serve:
+        # We are the resident daemon
+        from .daemon import Daemon
+        preroll = args.preroll if args.preroll is not None else int(CONFIG.setting('preroll_ms', 0))
+        Daemon(args.backend, preroll / 1000).serve()
+    elif args.daemon:
         # We are the background worker
         worker_loop()
     else:
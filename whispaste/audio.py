@@ -3,89 +3,332 @@ Audio Engine: Recording and Transcription logic.
 Note: Optimized for instant recording start.
 """
 import os
-import wave
-import io
+import threading
+import time
 from typing import Optional
 from .config import CONFIG
 from .system import System
+from . import retry
+from . import transcribers
+from .buffer import BlockBuffer, RingBuffer
+from .stats import Trace
 
 class AudioEngine:
+    KEEPALIVE_SECONDS = 60
+    LISTEN_BLOCK = 0.1      # Seconds per callback while listening (fewer wakeups)
+    MAX_PREROLL = 5.0
+    LIVENESS_CHECK = 0.5    # Seconds between checks that a recording stream is alive
+
     def __init__(self, sample_rate=16000):
         self.sample_rate = sample_rate
-        self.buffer = []
+        self.buffer = None
+        # Pre-roll listening (see listen())
+        self.listener = None
+        self.ring = None
+        self.target = None      # (BlockBuffer, on_block, stop, landed) while a session records
+        self.route_lock = threading.Lock()
+        self.usage = {}
+        self.client = None
+        self.http = None
+        self.client_lock = threading.Lock()
+        self.transcribers = {}
+
+    def warm_up(self, backend=None):
+        """
+        Load the heavy modules, the API client and the transcription
+        backend ahead of time.
+        Only worth it in a long-lived process (see daemon.py).
+        """
+        import sounddevice as sd  # Initializes PortAudio
+        import numpy as np
+        sd.query_devices()
+        self.get_client()
+        self.get_transcriber(backend).warm_up()
+
+    def get_transcriber(self, backend=None):
+        """
+        Backend by name (default from WHISPASTE_BACKEND), created once per engine
+        so a local model stays loaded.
+        """
+        name = backend or CONFIG.setting('backend', 'openai')
+        if name not in self.transcribers:
+            self.transcribers[name] = transcribers.create(name, self.get_client)
+        return self.transcribers[name]
+
+    def get_client(self):
+        """
+        Create the OpenAI client once and reuse it for every request.
+        Transcription and post-processing share its keep-alive connection pool.
+        """
+        with self.client_lock:
+            if self.client is None:
+                CONFIG.load_env()
+                api_key = os.getenv('OPENAI_API_KEY')
+                if not api_key:
+                    return None
+                # Lazy Import: OpenAI client is heavy
+                from openai import OpenAI, DefaultHttpxClient, DEFAULT_CONNECTION_LIMITS
+                Limits = type(DEFAULT_CONNECTION_LIMITS)  # httpx.Limits
+                try:
+                    import h2  # HTTP/2 is optional
+                    http2 = True
+                except ImportError:
+                    http2 = False
+                self.http = DefaultHttpxClient(
+                    http2=http2,
+                    # httpx drops idle connections after 5s by default,
+                    # which is shorter than most dictations
+                    limits=Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=self.KEEPALIVE_SECONDS),
+                )
+                # Retries and timeouts are handled per call (see retry.py)
+                self.client = OpenAI(api_key=api_key, http_client=self.http, max_retries=0)
+            return self.client
+
+    def preconnect(self, stop: threading.Event):
+        """
+        Open a pooled connection to the API in the background and keep it
+        warm until stop is set, so DNS/TCP/TLS setup is done before the
+        upload starts.
+        """
+        def run():
+            client = self.get_client()
+            if client is None:
+                return
+            while True:
+                try:
+                    # Any response will do; it leaves a live connection in the pool
+                    self.http.head(str(client.base_url), timeout=5)
+                except Exception as e:
+                    System.log(f"Preconnect failed: {e}")
+                if stop.wait(self.KEEPALIVE_SECONDS / 2):
+                    return
+
+        threading.Thread(target=run, daemon=True).start()
         
-    def record_until_stop(self, check_stop_fn):
+    def listen(self, preroll: float):
+        """
+        Keep the microphone open between sessions and remember the last
+        preroll seconds in a preallocated ring buffer, so words spoken right
+        at the hotkey are not clipped. The ring never leaves memory unless a
+        session starts. Opt-in, resident daemon only (--preroll).
+        """
+        import sounddevice as sd
+
+        preroll = min(preroll, self.MAX_PREROLL)
+        self.ring = RingBuffer(int(preroll * self.sample_rate))
+        self.usage = {'blocks': 0, 'callback_seconds': 0.0,
+                      'since': time.monotonic(), 'cpu': time.process_time()}
+
+        def callback(indata, frames, time_info, status):
+            start = time.perf_counter()
+            with self.route_lock:
+                if self.target is None:
+                    self.ring.write(indata)
+                else:
+                    buffer, on_block, stop, landed = self.target
+                    buffer.append(indata)
+                    if on_block is not None:
+                        on_block(indata)
+                    if stop.is_set():
+                        landed.set()  # The block in flight at the stop is in
+            self.usage['blocks'] += 1
+            self.usage['callback_seconds'] += time.perf_counter() - start
+
+        self.listener = sd.InputStream(
+            samplerate=self.sample_rate, channels=1, dtype='int16', callback=callback,
+            blocksize=int(self.sample_rate * self.LISTEN_BLOCK), latency='high'
+        )
+        self.listener.start()
+
+    def stop_listening(self):
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def listen_usage(self):
+        """
+        What listening costs: ring size, callback time and process CPU
+        since listen() (the process figure includes everything else too).
+        """
+        if self.listener is None:
+            return None
+        wall = max(1e-9, time.monotonic() - self.usage['since'])
+        blocks = max(1, self.usage['blocks'])
+        return {
+            'preroll_ms': round(len(self.ring.data) / self.sample_rate * 1000),
+            'ring_bytes': self.ring.nbytes,
+            'blocks': self.usage['blocks'],
+            'callback_us': round(self.usage['callback_seconds'] / blocks * 1e6, 1),
+            'callback_cpu_percent': round(self.usage['callback_seconds'] / wall * 100, 3),
+            'process_cpu_percent': round((time.process_time() - self.usage['cpu']) / wall * 100, 2),
+        }
+
+    def record_from_listener(self, stop: threading.Event, on_block=None, allocate=None):
+        """
+        record_until_stop() on the open listening stream: the pre-roll
+        becomes the start of the recording, then live blocks follow.
         """
-        Records audio until check_stop_fn returns True.
+        buffer = self.buffer = BlockBuffer(self.sample_rate, allocate)
+        with self.route_lock:
+            preroll = self.ring.take()
+            if len(preroll):
+                buffer.append(preroll)
+                if on_block is not None:
+                    on_block(preroll)
+            landed = threading.Event()
+            self.target = (buffer, on_block, stop, landed)
+        try:
+            while not stop.wait(self.LIVENESS_CHECK) and self.listener.active:
+                pass
+            # Let the block in flight land before detaching (the next callback
+            # after the stop); bounded in case the stream dies meanwhile
+            if self.listener.active:
+                landed.wait(2 * self.LISTEN_BLOCK)
+        finally:
+            with self.route_lock:
+                self.target = None
+        if not len(buffer):
+            return None
+        return buffer
+
+    def record_until_stop(self, stop: threading.Event, on_block=None, allocate=None):
+        """
+        Records audio until stop is set (by a signal, a control message or
+        the endpointer in on_block); wakes up the moment it is.
         Imports and starts recording as fast as possible.
+        Captures int16 straight into a BlockBuffer (no per-callback copies).
+        on_block (optional) is called from the audio thread with each raw block
+        after it has been stored; the block is only valid during the call.
+        allocate is the BlockBuffer hook (the spool maps blocks from a file).
         """
+        if self.listener is not None:
+            if self.listener.active:
+                return self.record_from_listener(stop, on_block, allocate)
+            # Device went away while listening; open a fresh stream below
+            System.log("Listening stream stopped; recording without pre-roll")
+            self.stop_listening()
+
         # Import at call time for fastest possible startup
         import sounddevice as sd
-        import numpy as np
         
+        # Local reference: in the daemon the next recording may replace
+        # self.buffer while this one is still finishing
+        buffer = self.buffer = BlockBuffer(self.sample_rate, allocate)
         def callback(indata, frames, time, status):
-            self.buffer.append(indata.copy())
+            buffer.append(indata)
+            if on_block is not None:
+                on_block(indata)
             
         # Start recording immediately - PortAudio init happens here
-        with sd.InputStream(samplerate=self.sample_rate, channels=1, callback=callback):
-            while not check_stop_fn():
-                sd.sleep(50)
+        def open_stream():
+            return sd.InputStream(samplerate=self.sample_rate, channels=1, dtype='int16', callback=callback)
+        try:
+            stream = open_stream()
+        except sd.PortAudioError:
+            # A warm process keeps the device list from startup; rescan once
+            # in case the microphone was plugged in since then.
+            sd._terminate()
+            sd._initialize()
+            stream = open_stream()
+        with stream:
+            # The timeout only checks that the device is still delivering
+            while not stop.wait(self.LIVENESS_CHECK) and stream.active:
+                pass
                 
-        if not self.buffer:
+        if not len(buffer):
             return None
-        return np.concatenate(self.buffer)
+        return buffer
+
+    def transcribe_audio(self, audio_data, encoder='auto', backend=None, sample_rate=None) -> str:
+        """
+        One transcription request, no post-processing. Raises on errors.
+        Safe to call from worker threads (used for streamed segments and
+        batch files, which bring their own sample rate).
+        """
+        sample_rate = sample_rate or self.sample_rate
+        transcriber = self.get_transcriber(backend)
+        payload = transcriber.prepare(audio_data, sample_rate, encoder)
+        return transcriber.transcribe(payload, sample_rate)
+
+    def refine(self, text, post_prompt, post_model=None, notify=True) -> str:
+        """
+        Optional post-processing of the transcript with a chat model.
+        """
+        if not (post_prompt and text):
+            return text
+        if notify:
+            System.notify("Refining text...")
+        client = self.get_client()
+        completion = retry.call(lambda timeout: client.chat.completions.create(
+            model=post_model or 'gpt-4o-mini',
+            messages=[
+                {'role': 'system', 'content': post_prompt},
+                {'role': 'user', 'content': text}
+            ],
+            timeout=timeout
+        ), 'refine')
+        return completion.choices[0].message.content.strip()
 
-    def transcribe(self, audio_data, post_prompt=None, post_model=None) -> Optional[str]:
+    def refine_stream(self, text, post_prompt, post_model=None):
         """
-        Sends audio data to OpenAI Whisper API.
+        Like refine(), but yields the completion text as it is generated.
+        Only opening the stream is retried; once text has been inserted,
+        starting over would duplicate it.
+        """
+        System.notify("Refining text...")
+        client = self.get_client()
+        stream = retry.call(lambda timeout: client.chat.completions.create(
+            model=post_model or 'gpt-4o-mini',
+            messages=[
+                {'role': 'system', 'content': post_prompt},
+                {'role': 'user', 'content': text}
+            ],
+            stream=True,
+            timeout=timeout
+        ), 'refine', hedge=False)
+        for event in stream:
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+
+    def transcribe(self, audio_data, post_prompt=None, post_model=None, segments=None, encoder='auto', backend=None, trace=None) -> Optional[str]:
+        """
+        Sends audio data to the transcription backend (OpenAI by default).
+        audio_data is a list of int16 chunks (or a single array).
+        If a SegmentStreamer is given, its already-uploaded segments are
+        collected instead of uploading audio_data in one piece.
+        Phase timings go to trace (see stats.py), if given.
         """
         if audio_data is None: return None
+        trace = trace or Trace()
         
-        CONFIG.load_env()
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
+        try:
+            transcriber = self.get_transcriber(backend)
+        except ValueError as e:
+            System.notify(str(e))
+            return None
+
+        # Encode in the background while the client is being prepared
+        payload = None
+        if segments is None:
+            payload = transcriber.prepare(audio_data, self.sample_rate, encoder)
+            if hasattr(payload, 'add_done_callback'):
+                payload.add_done_callback(lambda _: trace.since_stop('encode'))
+
+        if (transcriber.name == 'openai' or post_prompt) and self.get_client() is None:
             System.notify("Error: OPENAI_API_KEY not found")
             return None
 
-        # Lazy Import: OpenAI client is heavy
-        import numpy as np
-        from openai import OpenAI
-        
-        # Convert numpy array to WAV in memory
-        wav_buffer = io.BytesIO()
-        with wave.open(wav_buffer, 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)
-            wf.setframerate(self.sample_rate)
-            # Normalize and convert to 16-bit PCM
-            wf.writeframes((audio_data * 32767).astype(np.int16).tobytes())
-        wav_buffer.seek(0)
-        wav_buffer.name = "audio.wav" 
-
-        client = OpenAI(api_key=api_key)
-        
         try:
             System.notify("Transcribing...")
-            transcript = client.audio.transcriptions.create(
-                model='gpt-4o-mini-transcribe', # Using the optimized model
-                file=wav_buffer,
-                response_format='text'
-            )
-            text = str(transcript).strip()
-            
-            # Optional Post-Processing
-            if post_prompt and text:
-                System.notify("Refining text...")
-                completion = client.chat.completions.create(
-                    model=post_model or 'gpt-4o-mini',
-                    messages=[
-                        {'role': 'system', 'content': post_prompt},
-                        {'role': 'user', 'content': text}
-                    ]
-                )
-                text = completion.choices[0].message.content.strip()
-                
-            return text
+            with trace.span('transcribe'):
+                if segments is not None:
+                    text = segments.collect()
+                else:
+                    text = transcriber.transcribe(payload, self.sample_rate)
+            if not post_prompt:
+                return text
+            with trace.span('refine'):
+                return self.refine(text, post_prompt, post_model)
         except Exception as e:
             System.notify(f"API Error: {str(e)}")
             System.log(f"API Error: {e}")
@@ -0,0 +1,155 @@
+"""
+Backend Detection: Probe clipboard/input tools once instead of on every call.
+Candidates are filtered by session type (Wayland/X11/macOS/Windows) and
+resolved with shutil.which; the result is cached until that environment changes.
+"""
+import os
+import platform
+import shutil
+from typing import Dict, List, Tuple
+
+# Operation -> [(session type, command prefix)] in order of preference
+CANDIDATES: Dict[str, List[Tuple[str, List[str]]]] = {
+    'read_clipboard': [
+        ('wayland', ['wl-paste']),
+        ('x11', ['xclip', '-selection', 'clipboard', '-o']),
+        ('x11', ['xsel', '--clipboard', '--output']),
+        ('darwin', ['pbpaste']),
+        ('windows', ['powershell', '-command', 'Get-Clipboard']),
+    ],
+    'read_primary': [
+        ('wayland', ['wl-paste', '--primary']),
+        ('x11', ['xclip', '-selection', 'primary', '-o']),
+        ('x11', ['xsel', '--primary', '--output']),
+    ],
+    'write_primary': [
+        ('wayland', ['wl-copy', '--primary']),
+        ('x11', ['xclip', '-selection', 'primary']),
+        ('x11', ['xsel', '--primary', '--input']),
+    ],
+    'write_clipboard': [
+        ('wayland', ['wl-copy']),
+        ('x11', ['xclip', '-selection', 'clipboard']),
+        ('x11', ['xsel', '--clipboard', '--input']),
+        ('darwin', ['pbcopy']),
+        ('windows', ['clip']),
+    ],
+    # MIME-aware snapshots; the MIME type is appended to read_type/write_type
+    'list_types_clipboard': [
+        ('wayland', ['wl-paste', '--list-types']),
+        ('x11', ['xclip', '-selection', 'clipboard', '-t', 'TARGETS', '-o']),
+    ],
+    'list_types_primary': [
+        ('wayland', ['wl-paste', '--primary', '--list-types']),
+        ('x11', ['xclip', '-selection', 'primary', '-t', 'TARGETS', '-o']),
+    ],
+    'read_type_clipboard': [
+        ('wayland', ['wl-paste', '--no-newline', '--type']),
+        ('x11', ['xclip', '-selection', 'clipboard', '-o', '-t']),
+    ],
+    'read_type_primary': [
+        ('wayland', ['wl-paste', '--primary', '--no-newline', '--type']),
+        ('x11', ['xclip', '-selection', 'primary', '-o', '-t']),
+    ],
+    'write_type_clipboard': [
+        ('wayland', ['wl-copy', '--type']),
+        ('x11', ['xclip', '-selection', 'clipboard', '-t']),
+    ],
+    'write_type_primary': [
+        ('wayland', ['wl-copy', '--primary', '--type']),
+        ('x11', ['xclip', '-selection', 'primary', '-t']),
+    ],
+    'paste': [
+        # Shift+Insert / middle-click paste from PRIMARY; Cmd+V on macOS
+        ('wayland', ['wtype', '-M', 'shift', '-k', 'Insert', '-m', 'shift']),
+        ('x11', ['xdotool', 'key', 'shift+Insert']),
+        ('x11', ['xdotool', 'click', '2']),
+        ('darwin', ['osascript', '-e', 'tell application "System Events" to keystroke "v" using command down']),
+    ],
+    'type': [
+        # The text (or AppleScript) is appended to these, see typer.command()
+        ('wayland', ['wtype', '--']),
+        ('linux', ['ydotool', 'type', '--']),
+        ('x11', ['xdotool', 'type', '--clearmodifiers', '--']),
+        ('darwin', ['osascript', '-e']),
+    ],
+}
+
+_cache: Dict = {}
+
+def environment() -> Tuple[str, bool, bool]:
+    return (
+        platform.system(),
+        bool(os.environ.get('WAYLAND_DISPLAY')),
+        bool(os.environ.get('DISPLAY')),
+    )
+
+def _probe(operation: str, env: Tuple[str, bool, bool]) -> List[List[str]]:
+    system, wayland, x11 = env
+    linux = system == 'Linux'
+    if linux and not (wayland or x11):
+        # No session variables (e.g. started from a service): try everything
+        wayland = x11 = True
+    usable = {
+        'wayland': linux and wayland,
+        'x11': linux and x11,
+        'linux': linux,
+        'darwin': system == 'Darwin',
+        'windows': system == 'Windows',
+    }
+    commands = []
+    for session, cmd in CANDIDATES[operation]:
+        path = shutil.which(cmd[0]) if usable[session] else None
+        if path:
+            commands.append([path] + cmd[1:])
+    return commands
+
+def commands(operation: str) -> List[List[str]]:
+    """
+    Usable commands for an operation, best first. Probed once per environment.
+    """
+    env = environment()
+    if _cache.get('env') != env:
+        _cache.clear()
+        _cache['env'] = env
+    if operation not in _cache:
+        _cache[operation] = _probe(operation, env)
+    return _cache[operation]
+
+def invalidate():
+    _cache.clear()
+
+if __name__ == '__main__':
+    # python -m whispaste.backends: show the choice and time the insert-path reads
+    import time
+    from .clipboard import Clipboard
+
+    for operation in CANDIDATES:
+        print(f"{operation:>15}: {' | '.join(c[0] for c in commands(operation)) or '-'}")
+
+    def timed(fn, rounds=20):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            fn()
+        return (time.perf_counter() - start) / rounds * 1000
+
+    def chain(operation):
+        # What every read used to do: walk all candidates until one works
+        import subprocess
+        for _, cmd in CANDIDATES[operation]:
+            try:
+                if subprocess.run(cmd, capture_output=True, text=True, timeout=2).returncode == 0:
+                    return
+            except (subprocess.TimeoutExpired, FileNotFoundError):
+                pass
+
+    def backup_chain():
+        chain('read_clipboard')
+        chain('read_primary')
+
+    def backup_cached():
+        Clipboard.read_clipboard()
+        Clipboard.read_primary()
+
+    print(f"backup, full fallback chain: {timed(backup_chain):.1f} ms")
+    print(f"backup, cached backends:     {timed(backup_cached):.1f} ms")
@@ -0,0 +1,276 @@
+"""
+Batch Transcription: `whispaste transcribe FILE...` for audio already on disk.
+WAV files are memory-mapped, so only the part being encoded is paged in;
+FLAC and anything else libsndfile reads are read segment by segment.
+Long files are cut at the quietest moment before every SEGMENT_SECONDS (and
+well under the upload limit). A cut that has to fall into speech re-sends a
+little overlap, and the duplicated words are dropped again when stitching.
+Segments of all files share one bounded pool of workers. Templates and
+--prompt run once per file, on the stitched transcript.
+"""
+import json
+import mmap
+import re
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from .system import System
+from . import cleanup, vad
+
+SEGMENT_SECONDS = 300           # Target length; shorter means more parallel uploads
+SEARCH_SECONDS = 30             # How far back from the target to look for a pause
+PAUSE_SECONDS = 0.3             # Quiet stretch to cut in
+SILENCE_RMS = 0.01              # Below this (full scale 1.0) the cut counts as silent
+OVERLAP_SECONDS = 2.0           # Re-sent across a cut in the middle of speech
+MAX_OVERLAP_WORDS = 20          # Longest duplicated run looked for when stitching
+UPLOAD_LIMIT = 25 * 1024 * 1024 # Per-file API limit (segments are sized as 16-bit WAV)
+JOBS = 4
+
+class WavSource:
+    """
+    PCM16 or float32 WAV, memory-mapped. read() returns views into the file
+    (mono) or a downmixed copy of just that range (multichannel).
+    """
+    FORMATS = {(1, 16): '<i2', (3, 32): '<f4'}  # (format tag, bits) -> dtype
+
+    def __init__(self, path: Path):
+        import numpy as np
+
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (tag, channels, rate, bits), offset, size = self.parse(self.map)
+        dtype = self.FORMATS.get((tag, bits))
+        if dtype is None:
+            raise ValueError(f"unsupported WAV encoding (format {tag}, {bits} bit)")
+        size = min(size, len(self.map) - offset)  # Streamed WAVs may claim more
+        frame = np.dtype(dtype).itemsize * channels
+        self.samples = np.frombuffer(self.map, dtype=dtype, count=size // frame * channels,
+                                     offset=offset).reshape(-1, channels)
+        self.sample_rate = rate
+        self.frames = len(self.samples)
+
+    @staticmethod
+    def parse(data) -> Tuple[Tuple[int, int, int, int], int, int]:
+        """((format tag, channels, rate, bits), data offset, data size)"""
+        if data[:4] != b'RIFF' or data[8:12] != b'WAVE':
+            raise ValueError("not a RIFF/WAVE file")
+        fmt, position = None, 12
+        while position + 8 <= len(data):
+            chunk, size = struct.unpack_from('<4sI', data, position)
+            body = position + 8
+            if chunk == b'fmt ':
+                tag, channels, rate, _, _, bits = struct.unpack_from('<HHIIHH', data, body)
+                if tag == 0xFFFE and size >= 26:  # WAVE_FORMAT_EXTENSIBLE: real tag leads the GUID
+                    tag = struct.unpack_from('<H', data, body + 24)[0]
+                fmt = (tag, channels, rate, bits)
+            elif chunk == b'data':
+                if fmt is None:
+                    raise ValueError("data chunk before fmt chunk")
+                return fmt, body, size
+            position = body + size + (size & 1)  # Chunks are word-aligned
+        raise ValueError("no data chunk")
+
+    def read(self, start: int, end: int):
+        block = self.samples[start:end]
+        if block.shape[1] == 1:
+            return block.reshape(-1)
+        return block.mean(axis=1).astype(block.dtype)
+
+class SoundFileSource:
+    """Any format libsndfile reads (FLAC, OGG...), decoded one range at a time."""
+    def __init__(self, path: Path):
+        try:
+            import soundfile
+        except (ImportError, OSError):
+            raise RuntimeError("reading this format needs soundfile (pip install whispaste[compress])")
+        self.file = soundfile.SoundFile(str(path))
+        self.lock = threading.Lock()  # One decoder position per file
+        self.sample_rate = self.file.samplerate
+        self.frames = self.file.frames
+
+    def read(self, start: int, end: int):
+        import numpy as np
+
+        with self.lock:
+            self.file.seek(start)
+            block = self.file.read(end - start, dtype='int16', always_2d=True)
+        if block.shape[1] == 1:
+            return block.reshape(-1)
+        return block.mean(axis=1).astype(np.int16)
+
+def open_source(path: Path):
+    with open(path, 'rb') as f:
+        riff = f.read(4) == b'RIFF'
+    if riff:
+        try:
+            return WavSource(path)
+        except ValueError:
+            pass  # Compressed or exotic WAV: let libsndfile try
+    return SoundFileSource(path)
+
+def find_pause(source, lo: int, hi: int) -> Tuple[int, bool]:
+    """
+    Quietest PAUSE_SECONDS in [lo, hi): (sample to cut at, whether it is silent).
+    """
+    import numpy as np
+
+    audio = source.read(lo, hi)
+    frame = max(1, int(source.sample_rate * vad.FRAME_MS / 1000))
+    count = len(audio) // frame
+    if count == 0:
+        return hi, False
+    frames = audio[:count * frame].reshape(count, frame).astype(np.float32)
+    if audio.dtype == np.int16:
+        frames /= 32768
+    energy = np.mean(np.square(frames), axis=1)
+    width = max(1, min(count, int(PAUSE_SECONDS * 1000 / vad.FRAME_MS)))
+    window = np.convolve(energy, np.ones(width) / width, mode='valid')
+    best = int(np.argmin(window))
+    cut = lo + (best + width // 2) * frame
+    return cut, float(np.sqrt(window[best])) < SILENCE_RMS
+
+def split(source, segment_seconds: float = SEGMENT_SECONDS) -> List[Tuple[int, int, bool]]:
+    """
+    (start, end, overlaps previous) sample ranges covering the whole source.
+    """
+    rate = source.sample_rate
+    seconds = min(segment_seconds, UPLOAD_LIMIT * 0.95 / (rate * 2))
+    target, search = int(seconds * rate), int(min(SEARCH_SECONDS, seconds / 4) * rate)
+    overlap = int(OVERLAP_SECONDS * rate)
+
+    segments, start, overlapping = [], 0, False
+    while source.frames - start > target:
+        cut, silent = find_pause(source, start + target - search, start + target)
+        segments.append((start, cut, overlapping))
+        overlapping = not silent
+        start = cut if silent else max(start + 1, cut - overlap)
+    segments.append((start, source.frames, overlapping))
+    return segments
+
+def _words(text: str) -> List[str]:
+    return [re.sub(r'\W+', '', word.lower()) for word in text.split()]
+
+def stitch(previous: str, text: str) -> str:
+    """
+    Drop the words at the start of text that repeat the end of previous
+    (what the overlap transcribed twice).
+    """
+    tail, head, words = _words(previous)[-MAX_OVERLAP_WORDS:], _words(text), text.split()
+    for n in range(min(len(tail), len(head)), 0, -1):
+        if tail[-n:] == head[:n]:
+            return ' '.join(words[n:])
+    return text
+
+class Batch:
+    def __init__(self, opts: Dict[str, Any], jobs: int = JOBS):
+        from .audio import AudioEngine
+
+        self.opts = opts
+        self.engine = AudioEngine()
+        self.pool = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='batch')
+
+    def transcribe_segment(self, source, start: int, end: int) -> str:
+        chunks = [source.read(start, end)]
+        if self.opts.get('vad', True):
+            chunks, _ = vad.trim_silence(chunks, source.sample_rate)
+            if chunks is None:
+                return ''
+        return self.engine.transcribe_audio(chunks, self.opts.get('encoder', 'auto'),
+                                            self.opts.get('backend'), sample_rate=source.sample_rate)
+
+    def refine(self, text: str) -> str:
+        """
+        Template/prompt for a whole file. Segments are refined together:
+        rewritten text would no longer stitch, and a template like email
+        should produce one email per file.
+        """
+        prompt = self.opts.get('prompt')
+        if self.opts.get('template') == 'cleanup' and text:
+            text, prompt = cleanup.apply(text, prompt)
+        if prompt and text:
+            text = self.engine.refine(text, prompt, self.opts.get('model'), notify=False)
+        return text
+
+    def submit(self, path: Path) -> Dict[str, Any]:
+        """Open and split one file and queue its segments."""
+        job: Dict[str, Any] = {'file': str(path), 'started': time.perf_counter()}
+        try:
+            source = open_source(path)
+        except (OSError, RuntimeError, ValueError) as e:
+            job['error'] = str(e)
+            return job
+        job['duration'] = source.frames / source.sample_rate
+        job['segments'] = [
+            (start / source.sample_rate, end / source.sample_rate, overlapping,
+             self.pool.submit(self.transcribe_segment, source, start, end))
+            for start, end, overlapping in split(source)
+        ]
+        return job
+
+    def collect(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Wait for a file's segments, stitch them in order and refine the
+        result. The segments keep their raw transcripts.
+        """
+        result = {'file': job['file']}
+        if 'error' in job:
+            return {**result, 'error': job['error']}
+        text, segments, errors = '', [], []
+        for start, end, overlapping, future in job['segments']:
+            try:
+                piece = future.result()
+            except Exception as e:
+                errors.append(f"{start:.0f}-{end:.0f}s: {e}")
+                System.log(f"Batch: {job['file']} {start:.0f}-{end:.0f}s failed: {e}")
+                piece = ''
+            if overlapping and text:
+                piece = stitch(text, piece)
+            text = ' '.join(t for t in (text, piece) if t)
+            segments.append({'start': round(start, 2), 'end': round(end, 2), 'text': piece})
+        try:
+            text = self.refine(text)
+        except Exception as e:
+            # The raw transcript is still worth printing
+            errors.append(f"post-processing: {e}")
+            System.log(f"Batch: {job['file']} post-processing failed: {e}")
+        result.update({
+            'duration': round(job['duration'], 2),
+            'seconds': round(time.perf_counter() - job['started'], 2),
+            'text': text,
+            'segments': segments,
+        })
+        if errors:
+            result['error'] = '; '.join(errors)
+        return result
+
+def run(files: List[str], opts: Dict[str, Any], jobs: int = JOBS, jsonl: bool = False) -> int:
+    """
+    Transcribe files (in parallel) and print the results in input order:
+    plain text, or one JSON object per file with jsonl. Returns the exit code.
+    """
+    batch = Batch(opts, jobs)
+    failed = False
+    try:
+        submitted = [batch.submit(Path(f)) for f in files]
+        for job in submitted:
+            result = batch.collect(job)
+            failed = failed or 'error' in result
+            if jsonl:
+                print(json.dumps(result), flush=True)
+            else:
+                if 'error' in result:
+                    print(f"{result['file']}: {result['error']}", file=sys.stderr)
+                if result.get('text'):
+                    if len(files) > 1:
+                        print(f"== {result['file']} ==")
+                    print(result['text'], flush=True)
+            if 'duration' in result:
+                print(f"{result['file']}: {result['duration']:.0f}s of audio in {result['seconds']:.1f}s "
+                      f"({len(result['segments'])} segments)", file=sys.stderr)
+    finally:
+        batch.pool.shutdown(wait=False, cancel_futures=True)
+    return 1 if failed else 0
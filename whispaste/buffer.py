@@ -0,0 +1,107 @@
+"""
+Capture Buffer: int16 samples in preallocated, geometrically growing blocks.
+Appending never moves earlier audio, and readers get zero-copy views.
+"""
+from typing import List, Optional
+
+class BlockBuffer:
+    FIRST_BLOCK = 1.0   # Seconds; each new block doubles...
+    MAX_BLOCK = 64.0    # ...up to this size (one hour wastes at most ~2 MB)
+
+    def __init__(self, sample_rate: int, allocate=None):
+        self.sample_rate = sample_rate
+        self.blocks: List = []
+        self.fill = 0       # Samples used in the last block
+        self.length = 0     # Samples used in total
+        # allocate(samples) -> writable int16 array; np.zeros by default
+        self.allocate = allocate
+
+    def _grow(self):
+        import numpy as np
+
+        seconds = min(self.FIRST_BLOCK * 2 ** len(self.blocks), self.MAX_BLOCK)
+        size = int(seconds * self.sample_rate)
+        block = self.allocate(size) if self.allocate else np.zeros(size, dtype=np.int16)
+        self.blocks.append(block)
+        self.fill = 0
+
+    def append(self, samples):
+        """
+        Copy samples (any shape, int16) in. Safe to call from the audio callback:
+        after warm-up this is a memcpy plus, rarely, one block allocation.
+        """
+        samples = samples.reshape(-1)
+        while len(samples):
+            if not self.blocks or self.fill == len(self.blocks[-1]):
+                self._grow()
+            block = self.blocks[-1]
+            n = min(len(samples), len(block) - self.fill)
+            block[self.fill:self.fill + n] = samples[:n]
+            self.fill += n
+            self.length += n
+            samples = samples[n:]
+
+    def chunks(self, start: int = 0, end: Optional[int] = None) -> List:
+        """
+        Zero-copy views covering samples [start, end).
+        """
+        end = self.length if end is None else min(end, self.length)
+        views = []
+        offset = 0
+        for block in self.blocks:
+            lo, hi = max(start, offset), min(end, offset + len(block))
+            if lo < hi:
+                views.append(block[lo - offset:hi - offset])
+            offset += len(block)
+            if offset >= end:
+                break
+        return views
+
+    def __len__(self) -> int:
+        return self.length
+
+    @property
+    def duration(self) -> float:
+        return self.length / self.sample_rate
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes allocated (including the unused tail of the last block)."""
+        return sum(block.nbytes for block in self.blocks)
+
+class RingBuffer:
+    """
+    The most recent samples, in a fixed int16 array allocated once.
+    write() is at most two memcpys, so it is safe in the audio callback.
+    """
+    def __init__(self, samples: int):
+        import numpy as np
+
+        self.data = np.zeros(max(1, samples), dtype=np.int16)
+        self.position = 0   # Next write index
+        self.filled = 0
+
+    def write(self, samples):
+        samples = samples.reshape(-1)[-len(self.data):]
+        n = len(samples)
+        first = min(n, len(self.data) - self.position)
+        self.data[self.position:self.position + first] = samples[:first]
+        self.data[:n - first] = samples[first:]
+        self.position = (self.position + n) % len(self.data)
+        self.filled = min(len(self.data), self.filled + n)
+
+    def take(self):
+        """Copy out the contents, oldest first, and empty the ring."""
+        import numpy as np
+
+        start = (self.position - self.filled) % len(self.data)
+        if start + self.filled <= len(self.data):
+            samples = self.data[start:start + self.filled].copy()
+        else:
+            samples = np.concatenate([self.data[start:], self.data[:self.position]])
+        self.filled = 0
+        return samples
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
@@ -0,0 +1,195 @@
+"""
+Cleanup: The `cleanup` template without a round trip, when it can.
+Filler words are dropped and dictionary phrases replaced in one pass of an
+Aho-Corasick automaton (whole words, case-insensitive, longest match wins),
+then spacing, sentence capitals and the final period are fixed with a few
+regexes. The chat model is only asked when the transcript looks like it
+needs more than that (see needs_llm).
+
+User dictionary: dictionary.txt in the config dir, one entry per line:
+    k8s -> Kubernetes       # replace
+    whisper paste -> whispaste
+    basically               # drop, like um/uh
+Settings (environment or .env):
+- WHISPASTE_CLEANUP_LLM:       auto (default), always or never
+- WHISPASTE_CLEANUP_MAX_WORDS: longer transcripts go to the model (default 80)
+"""
+import re
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from .config import CONFIG
+from .system import System
+
+# Not 'er' or 'mm': they are words too ("an ER doctor", "5 mm long")
+FILLERS = ['um', 'umm', 'uh', 'uhm', 'uhh', 'erm', 'ah', 'hmm', 'mhm']
+MAX_WORDS = 80
+MIN_UNPUNCTUATED = 12   # Words without any sentence end before the model is asked
+
+DROPPED = '\x00'       # Marks where a filler was, until the commas around it are fixed
+SPACES = re.compile(r'[ \t]+')
+# "in, um, ten minutes": the commas were only there for the filler
+BRACKETED = re.compile(r',\s*\x00\s*,(?=\s*[a-z0-9])')
+# "Thanks, uh, that works": except after a sentence's first word
+AFTER_FIRST_WORD = re.compile(r'((?:^|[.!?]\s+)[\w\'’]+),\s*\x00\s*,(?=\s*[a-z0-9])')
+# "Um. So ..." / "Okay. Uh. Let's go.": the filler was a sentence of its own
+LONE_SENTENCE = re.compile(r'(^|[.!?]\s*)\x00\s*[.!?]+')
+SPACE_BEFORE = re.compile(r' +([,.;:!?])')
+REPEATED_COMMA = re.compile(r'([,;:])(?:\s*[,;:])+')
+LEADING_COMMA = re.compile(r'(^|[.!?]\s+)[,;:]\s*')
+COMMA_BEFORE_END = re.compile(r'[,;:]\s*([.!?])')
+# Not after the dots of "i.e." / "e.g.", nor at the start of one
+SENTENCE_START = re.compile(r'(^|(?<!\.\w)[.!?]\s+|\n\s*)([a-z])(?!\.\w)')
+# "i" as a word of its own, not in "i.e." or "a/i/b"
+LONE_I = re.compile(r'(?<![^\s"(])i(?=[\'’\s,;:!?)"]|\.(?!\w)|$)')
+SENTENCE_END = re.compile(r'[.!?]')
+
+class Automaton:
+    """
+    Aho-Corasick over lowercase patterns. Each pattern maps to its
+    replacement ('' drops it).
+    """
+    def __init__(self, patterns: Dict[str, str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[List[int]] = [[]]   # Pattern lengths ending at each state
+        self.replacements: Dict[str, str] = {}
+        for pattern, replacement in patterns.items():
+            key = ' '.join(pattern.lower().split())
+            if key:
+                self.add(key)
+                self.replacements[key] = replacement
+        self.link()
+
+    def add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.out[state].append(len(pattern))
+
+    def link(self):
+        """Breadth-first failure links; outputs are merged along them."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[child] = target if target != child else 0  # Depth 1 falls back to the root
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def matches(self, text: str) -> List[Tuple[int, int]]:
+        """(start, end) of whole-word matches in text (already lowercase)."""
+        found = []
+        state = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for length in out[state]:
+                start, end = index + 1 - length, index + 1
+                if (start == 0 or not _word_char(text[start - 1])) and (end == len(text) or not _word_char(text[end])):
+                    found.append((start, end))
+        return found
+
+    def replace(self, text: str, dropped: str = '') -> str:
+        """
+        Apply the leftmost-longest, non-overlapping matches. Dropped patterns
+        are replaced with dropped.
+        """
+        lower = text.lower()
+        if len(lower) != len(text):  # Rare characters that lowercase to several
+            lower = ''.join(c.lower() if len(c.lower()) == 1 else c for c in text)
+        matches = sorted(self.matches(lower), key=lambda m: (m[0], -m[1]))
+        pieces, position = [], 0
+        for start, end in matches:
+            if start < position:
+                continue
+            pieces.append(text[position:start])
+            pieces.append(self.replacements[lower[start:end]] or dropped)
+            position = end
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
+def _word_char(char: str) -> bool:
+    # Hyphens keep "mm-hmm" or "uh-oh" whole instead of matching their parts
+    return char.isalnum() or char in "_'-"
+
+def load_dictionary(text: str) -> Dict[str, str]:
+    entries = {}
+    for line in text.splitlines():
+        line = line.split('#', 1)[0].strip()
+        if not line:
+            continue
+        phrase, _, replacement = line.partition('->')
+        entries[phrase.strip()] = replacement.strip()
+    return entries
+
+_compiled: Dict[str, object] = {}
+
+def automaton() -> Automaton:
+    """Compiled fillers + user dictionary, rebuilt when dictionary.txt changes."""
+    path = CONFIG.dictionary_file
+    try:
+        stamp = path.stat().st_mtime_ns
+    except OSError:
+        stamp = None
+    if _compiled.get('stamp', -1) != stamp or 'automaton' not in _compiled:
+        patterns = {filler: '' for filler in FILLERS}
+        if stamp is not None:
+            try:
+                patterns.update(load_dictionary(path.read_text()))
+            except (OSError, UnicodeDecodeError) as e:
+                System.log(f"Cleanup: can't read {path}: {e}")
+        _compiled.update(stamp=stamp, automaton=Automaton(patterns))
+    return _compiled['automaton']
+
+def clean(text: str) -> str:
+    """Local cleanup: fillers, dictionary, spacing, capitals, final period."""
+    # Patterns are stored with single spaces, so match against single spaces
+    text = automaton().replace(SPACES.sub(' ', text), DROPPED)
+    text = AFTER_FIRST_WORD.sub(r'\1,', text)
+    text = BRACKETED.sub('', text)
+    text = LONE_SENTENCE.sub(r'\1', text).replace(DROPPED, '')
+    text = SPACES.sub(' ', text)
+    text = REPEATED_COMMA.sub(r'\1', text)
+    text = SPACE_BEFORE.sub(r'\1', text)
+    text = LEADING_COMMA.sub(r'\1', text.strip())
+    text = COMMA_BEFORE_END.sub(r'\1', text)
+    text = LONE_I.sub('I', text)
+    text = SENTENCE_START.sub(lambda m: m.group(1) + m.group(2).upper(), text)
+    text = SPACES.sub(' ', text).strip().rstrip(',;:')
+    if text and text[-1].isalnum():
+        text += '.'
+    return text
+
+def needs_llm(text: str) -> bool:
+    """
+    Whether the raw transcript needs the model: long dictation (likely to
+    need real restructuring), or a run of words with no sentence end at all.
+    """
+    mode = str(CONFIG.setting('cleanup_llm', 'auto')).lower()
+    if mode in ('always', 'never'):
+        return mode == 'always'
+    words = len(text.split())
+    if words > int(CONFIG.setting('cleanup_max_words', MAX_WORDS)):
+        return True
+    return words >= MIN_UNPUNCTUATED and not SENTENCE_END.search(text)
+
+def apply(text: str, prompt: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Clean text locally; returns it with the prompt still to run (None when
+    the local pass is enough).
+    """
+    llm = needs_llm(text)
+    cleaned = clean(text)
+    System.log(f"Cleanup: local pass, {'sending to the model' if llm else 'model skipped'}")
+    return cleaned, prompt if llm else None
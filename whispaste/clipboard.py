@@ -1,65 +1,64 @@
 """
 Clipboard Data Manager: Gets text IN and OUT of the system clipboard.
+Which tool to use is probed once (see backends.py), not on every call.
 """
-import platform
+import os
+import select
 import subprocess
+import time
+from typing import List, Optional, Tuple
+from .config import CONFIG
 from .system import System
+from . import backends
+
+# (MIME type, raw bytes) of one selection
+Snapshot = Tuple[str, bytes]
+
+# Which format to keep when a selection offers several (first match wins)
+PREFERRED_TYPES = (
+    'image/png', 'image/',
+    'text/uri-list', 'x-special/gnome-copied-files',
+    'text/plain;charset=utf-8', 'UTF8_STRING', 'text/plain', 'STRING', 'TEXT',
+)
+# X11 bookkeeping targets, never data
+META_TARGETS = {'TARGETS', 'TIMESTAMP', 'MULTIPLE', 'SAVE_TARGETS', 'DELETE', 'INCR'}
+BACKUP_MAX_BYTES = 8 * 1024 * 1024
 
 class Clipboard:
+    @staticmethod
+    def _read(operation: str) -> Optional[str]:
+        for cmd in backends.commands(operation):
+            try:
+                result = subprocess.run(cmd, capture_output=True, text=True, timeout=2)
+                if result.returncode == 0:
+                    return result.stdout
+            except (subprocess.TimeoutExpired, FileNotFoundError):
+                pass
+        return None
+
+    @staticmethod
+    def _write(operation: str, text: str) -> bool:
+        for cmd in backends.commands(operation):
+            if System.run(cmd, text): return True
+        return False
+
     @staticmethod
     def read_clipboard() -> str:
         """
         Read text from the system clipboard (Ctrl+C/Ctrl+V buffer).
         """
-        # 1. Try Wayland (native)
-        try:
-            result = subprocess.run(['wl-paste'], capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-        
-        # 2. Try X11 (native) - read from clipboard selection
-        try:
-            result = subprocess.run(['xclip', '-selection', 'clipboard', '-o'], 
-                                  capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-            
-        try:
-            result = subprocess.run(['xsel', '--clipboard', '--output'], 
-                                  capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-        
-        # 3. Try MacOS
-        try:
-            result = subprocess.run(['pbpaste'], capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-        
-        # 4. Try Windows
-        try:
-            result = subprocess.run(['powershell', '-command', 'Get-Clipboard'], 
-                                  capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-        
-        # 5. Fallback to Library (if installed/available)
+        # 1. Native tool (wl-paste, xclip/xsel, pbpaste, powershell)
+        text = Clipboard._read('read_clipboard')
+        if text is not None:
+            return text
+
+        # 2. Fallback to Library (if installed/available)
         try:
             import pyperclip
             return pyperclip.paste()
         except ImportError:
             pass
-            
+
         return ""
 
     @staticmethod
@@ -67,75 +66,129 @@ class Clipboard:
         """
         Read text from the X11 primary selection (mouse selection buffer).
         """
-        # 1. Try Wayland
-        try:
-            result = subprocess.run(['wl-paste', '--primary'], capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-        
-        # 2. Try X11 - read from primary selection
-        try:
-            result = subprocess.run(['xclip', '-selection', 'primary', '-o'], 
-                                  capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-            
-        try:
-            result = subprocess.run(['xsel', '--primary', '--output'], 
-                                  capture_output=True, text=True, timeout=2)
-            if result.returncode == 0:
-                return result.stdout
-        except (subprocess.TimeoutExpired, FileNotFoundError):
-            pass
-            
-        return ""
+        text = Clipboard._read('read_primary')
+        return text if text is not None else ""
+
+    @staticmethod
+    def wait_primary(text: str, timeout: float) -> bool:
+        """
+        Poll until the primary selection reads back as text, i.e. the selection
+        owner (wl-copy/xclip) is up and serving it. False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            if Clipboard.read_primary().rstrip('\n') == text.rstrip('\n'):
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
 
     @staticmethod
     def write_primary(text: str) -> bool:
         """
         Copy text to the X11 primary selection (for middle-click/Shift+Insert pasting).
         """
-        # 1. Try Wayland
-        if System.run(['wl-copy', '--primary'], text): return True
-        
-        # 2. Try X11 - write to primary selection
-        if System.run(['xclip', '-selection', 'primary'], text): return True
-        if System.run(['xsel', '--primary', '--input'], text): return True
-        
-        return False
+        return Clipboard._write('write_primary', text)
 
     @staticmethod
     def write_clipboard(text: str) -> bool:
         """
         Copy text to the system clipboard (for Ctrl+V pasting).
         """
-        # 1. Try Wayland (native)
-        if System.run(['wl-copy'], text): return True
-        
-        # 2. Try X11 (native)
-        if System.run(['xclip', '-selection', 'clipboard'], text): return True
-        if System.run(['xsel', '--clipboard', '--input'], text): return True
-        
-        # 3. Try MacOS
-        if System.run(['pbcopy'], text): return True
-        
-        # 4. Try Windows
-        if System.run(['clip'], text): return True
-        
-        # 5. Fallback to Library (if installed/available)
+        # 1. Native tool (wl-copy, xclip/xsel, pbcopy, clip)
+        if Clipboard._write('write_clipboard', text): return True
+
+        # 2. Fallback to Library (if installed/available)
         try:
             import pyperclip
             pyperclip.copy(text)
             return True
         except ImportError:
             pass
-            
+
         return False
 
+    @staticmethod
+    def list_types(selection: str = 'clipboard') -> List[str]:
+        """
+        Formats the selection owner offers ('clipboard' or 'primary').
+        """
+        text = Clipboard._read(f'list_types_{selection}')
+        if not text:
+            return []
+        return [t.strip() for t in text.splitlines() if t.strip() and t.strip() not in META_TARGETS]
+
+    @staticmethod
+    def _read_bytes(cmd: List[str], limit: int, timeout: float = 2) -> Optional[bytes]:
+        """
+        Run cmd and return its raw stdout, or None if it fails, times out or
+        produces more than limit bytes (the tool is killed right away).
+        """
+        try:
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            return None
+        deadline = time.monotonic() + timeout
+        fd = proc.stdout.fileno()
+        chunks, size = [], 0
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    return None
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > limit:
+                    return None
+                chunks.append(chunk)
+            return b''.join(chunks) if proc.wait(timeout=remaining) == 0 else None
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+
+    @staticmethod
+    def snapshot(selection: str = 'clipboard') -> Optional[Snapshot]:
+        """
+        Back up a selection as raw bytes in its richest format (image, file
+        list, text...) without decoding it. Returns None if empty or larger than
+        WHISPASTE_BACKUP_MAX_BYTES; the selection is then left alone instead.
+        Tools without MIME support (xsel, macOS, Windows) fall back to text.
+        """
+        readers = backends.commands(f'read_type_{selection}')
+        if not readers:
+            text = Clipboard.read_clipboard() if selection == 'clipboard' else Clipboard.read_primary()
+            return ('text/plain;charset=utf-8', text.encode()) if text else None
+
+        types = Clipboard.list_types(selection)
+        if not types:
+            return None
+        mime = next((t for prefix in PREFERRED_TYPES for t in types if t.startswith(prefix)), types[0])
+
+        limit = int(CONFIG.setting('backup_max_bytes', BACKUP_MAX_BYTES))
+        data = Clipboard._read_bytes(readers[0] + [mime], limit)
+        if data is None:
+            System.log(f"Backup of {selection} ({mime}) skipped: unreadable or over {limit} bytes")
+            return None
+        return mime, data
+
+    @staticmethod
+    def restore_snapshot(snapshot: Optional[Snapshot], selection: str = 'clipboard') -> bool:
+        """
+        Put a snapshot back, in the format it was taken in.
+        """
+        if not snapshot:
+            return False
+        mime, data = snapshot
+        for cmd in backends.commands(f'write_type_{selection}'):
+            if System.run(cmd + [mime], data): return True
+        text = data.decode(errors='replace')
+        return Clipboard.write_clipboard(text) if selection == 'clipboard' else Clipboard.write_primary(text)
+
     @staticmethod
     def read() -> str:
         """
@@ -143,7 +196,7 @@ class Clipboard:
         """
         return Clipboard.read_clipboard()
 
-    @staticmethod  
+    @staticmethod
     def write(text: str) -> bool:
         """
         Write to clipboard (backward compatibility).
@@ -2,10 +2,10 @@
 Configuration management for Whispaste.
 """
 import os
-import json
 import platform
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any
+from typing import Any
 
 class Config:
     APP_NAME = "whispaste"
@@ -19,13 +19,25 @@ class Config:
             base = Path.home() / 'Library' / 'Application Support'
         else:
             base = os.environ.get('XDG_CONFIG_HOME', Path.home() / '.config')
+        return Config._ensure_dir(str(base))
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _ensure_dir(base: str) -> Path:
+        # mkdir once per base directory, not on every property access
         path = Path(base) / Config.APP_NAME
         path.mkdir(parents=True, exist_ok=True)
         return path
 
     @property
-    def pid_file(self) -> Path: return self.get_dir() / 'recorder.pid'
-    
+    def state_file(self) -> Path: return self.get_dir() / 'state.json'
+
+    @property
+    def lock_file(self) -> Path: return self.get_dir() / 'toggle.lock'
+
+    @property
+    def recorder_lock(self) -> Path: return self.get_dir() / 'recorder.lock'
+
     @property
     def log_file(self) -> Path: return self.get_dir() / 'debug.log'
     
@@ -33,7 +45,19 @@ class Config:
     def env_file(self) -> Path: return self.get_dir() / '.env'
     
     @property
-    def opts_file(self) -> Path: return self.get_dir() / 'opts.json'
+    def stats_file(self) -> Path: return self.get_dir() / 'stats.jsonl'
+
+    @property
+    def dictionary_file(self) -> Path: return self.get_dir() / 'dictionary.txt'
+
+    @property
+    def spool_dir(self) -> Path: return self.get_dir() / 'spool'
+
+    @property
+    def queue_dir(self) -> Path: return self.get_dir() / 'queue'
+
+    @property
+    def socket_file(self) -> Path: return self.get_dir() / 'daemon.sock'
 
     def load_env(self):
         """Lazy load environment variables."""
@@ -42,23 +66,14 @@ class Config:
         load_dotenv(self.env_file)
         load_dotenv() # Check CWD as well
 
-    def save_opts(self, opts: Dict[str, Any]):
-        self.opts_file.write_text(json.dumps(opts))
-
-    def get_opts(self) -> Dict[str, Any]:
-        if not self.opts_file.exists():
-            return {}
-        try:
-            return json.loads(self.opts_file.read_text())
-        except:
-            return {}
-
-    def cleanup(self):
-        """Clean up temporary files."""
-        try:
-            if self.pid_file.exists(): self.pid_file.unlink()
-            if self.opts_file.exists(): self.opts_file.unlink()
-        except: pass
+    def setting(self, name: str, default: Any = None) -> Any:
+        """
+        Read a WHISPASTE_<NAME> setting from the environment or .env file.
+        """
+        key = f"WHISPASTE_{name.upper()}"
+        if key not in os.environ:
+            self.load_env()
+        return os.environ.get(key, default)
 
 # Singleton instance
 CONFIG = Config()
@@ -0,0 +1,38 @@
+"""
+Control Channel: Line-delimited JSON over a Unix socket.
+The CLI uses this to talk to a resident daemon instead of spawning a worker.
+"""
+import json
+import socket
+from typing import Any, Dict, Optional
+from .config import CONFIG
+
+def encode(msg: Dict[str, Any]) -> bytes:
+    return json.dumps(msg).encode() + b'\n'
+
+def decode(line: bytes) -> Dict[str, Any]:
+    msg = json.loads(line.decode())
+    if not isinstance(msg, dict):
+        raise ValueError(f"Expected a JSON object, got {type(msg).__name__}")
+    return msg
+
+def send_command(cmd: str, timeout: float = 2.0, **payload) -> Optional[Dict[str, Any]]:
+    """
+    Send a command to the resident daemon and return its reply.
+    Returns None if no daemon is listening (caller falls back to a worker).
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    path = CONFIG.socket_file
+    if not path.exists():
+        return None
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(encode({'cmd': cmd, **payload}))
+            line = sock.makefile('rb').readline()
+        return decode(line) if line else None
+    except (OSError, ValueError):
+        return None
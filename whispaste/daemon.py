@@ -0,0 +1,156 @@
+"""
+Resident Daemon: Keeps the interpreter, PortAudio and the OpenAI client warm.
+Started once with `whispaste --serve`; every toggle is then a socket message
+instead of a fresh process.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+from typing import Any, Dict
+from .config import CONFIG
+from .system import System
+from .audio import AudioEngine
+from .session import Session
+from . import control, toggle
+
+class Daemon:
+    def __init__(self, backend=None, preroll=0.0):
+        self.engine = AudioEngine()
+        self.backend = backend
+        self.preroll = preroll  # Seconds of audio kept from before each toggle
+        self.stop_event = threading.Event()  # Of the current recording
+        self.lock = threading.Lock()
+        self.state = 'idle'  # idle <-> recording; processing runs alongside
+        self.processing = 0  # Sessions transcribing/delivering in the background
+        self.pressed = 0.0   # monotonic() of the last toggle, for debouncing
+
+    def serve(self):
+        """
+        Warm up, then answer control messages until SIGTERM/SIGINT.
+        """
+        if control.send_command('status') is not None:
+            System.notify("Daemon already running.")
+            return
+
+        try:
+            self.engine.warm_up(self.backend)
+        except Exception as e:
+            # Still serve; the session will report the problem when it happens
+            System.log(f"Warm-up failed: {e}")
+
+        if self.preroll > 0:
+            try:
+                self.engine.listen(self.preroll)
+            except Exception as e:
+                System.log(f"Pre-roll listening failed: {e}")
+
+        path = CONFIG.socket_file
+        path.unlink(missing_ok=True)  # Stale socket from a crashed daemon
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(path))
+        os.chmod(path, 0o600)
+        server.listen()
+
+        def shutdown_handler(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, shutdown_handler)
+        signal.signal(signal.SIGINT, shutdown_handler)
+        System.log(f"Daemon listening on {path}")
+
+        try:
+            while True:
+                conn, _ = server.accept()
+                with conn:
+                    self.handle(conn)
+        finally:
+            self.stop_event.set()
+            self.engine.stop_listening()
+            server.close()
+            path.unlink(missing_ok=True)
+
+    def handle(self, conn: socket.socket):
+        try:
+            conn.settimeout(2)
+            msg = control.decode(conn.makefile('rb').readline())
+            reply = self.dispatch(msg)
+        except (OSError, ValueError) as e:
+            reply = {'ok': False, 'error': str(e)}
+        except Exception as e:
+            # Whatever a client sends must not kill the daemon
+            System.log(f"Daemon: {e!r} handling a message")
+            reply = {'ok': False, 'error': str(e)}
+        try:
+            conn.sendall(control.encode(reply))
+        except OSError:
+            pass
+
+    def dispatch(self, msg: Dict[str, Any]) -> Dict[str, Any]:
+        cmd = msg.get('cmd')
+        opts = msg.get('opts', {})
+        if not isinstance(opts, dict):
+            return {'ok': False, 'error': f"Expected opts to be an object, got {type(opts).__name__}"}
+        with self.lock:
+            if cmd == 'toggle':
+                now = time.monotonic()
+                if now - self.pressed < toggle.debounce():
+                    return {'ok': True, 'state': self.state, 'debounced': True}
+                self.pressed = now
+                if self.state == 'recording':
+                    return self.stop()
+                return self.start(opts)
+            if cmd == 'start':
+                return self.start(opts)
+            if cmd == 'stop':
+                return self.stop()
+            if cmd == 'status':
+                return {'ok': True, 'state': self.state, 'processing': self.processing,
+                        'listening': self.engine.listen_usage()}
+        return {'ok': False, 'error': f"Unknown command: {cmd}"}
+
+    def start(self, opts: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Start recording, even while earlier sessions are still processing.
+        """
+        if self.state != 'idle':
+            return {'ok': False, 'state': self.state}
+        self.state = 'recording'
+        if not opts.get('backend') and self.backend:
+            # The backend the daemon was started (and warmed up) with
+            opts = dict(opts, backend=self.backend)
+        # Each session gets its own event; the previous one may still be
+        # finishing its last audio block
+        self.stop_event = threading.Event()
+        threading.Thread(target=self.run_session, args=(opts, self.stop_event), daemon=True).start()
+        return {'ok': True, 'state': self.state}
+
+    def stop(self) -> Dict[str, Any]:
+        if self.state != 'recording':
+            return {'ok': False, 'state': self.state}
+        self.stop_event.set()
+        self.state = 'idle'  # Ready for the next recording right away
+        self.processing += 1
+        return {'ok': True, 'state': self.state, 'processing': self.processing}
+
+    def run_session(self, opts: Dict[str, Any], stop_event: threading.Event):
+        try:
+            session = Session(self.engine, opts)
+            session.record(stop_event)
+            with self.lock:
+                if self.stop_event is stop_event and self.state == 'recording':
+                    # Ended by the endpointer (auto-stop), not by a toggle
+                    self.state = 'idle'
+                    self.processing += 1
+            session.process()
+        except Exception as e:
+            System.notify(f"Critical Error: {e}")
+            System.log(str(e))
+        finally:
+            with self.lock:
+                if stop_event.is_set():
+                    self.processing -= 1
+                elif self.stop_event is stop_event:
+                    # Recording failed before anyone stopped it
+                    self.state = 'idle'
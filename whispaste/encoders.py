@@ -0,0 +1,226 @@
+"""
+Audio Encoders: Turn captured PCM into an upload-ready file.
+WAV needs nothing extra; FLAC and Opus use the optional `soundfile` package
+(libsndfile) and fall back to WAV when it is missing.
+Input is a list of int16 chunks (views of the capture buffer).
+"""
+import io
+import struct
+import sys
+import time
+from typing import Dict, List, Optional
+
+AUTO_FLAC_SECONDS = 10    # Below this, WAV is small enough and costs no CPU
+UPLOAD_LIMIT = 25 * 1024 * 1024  # Per-file API limit
+FLAC_RATIO = 0.6          # FLAC size of (noisy) speech relative to 16-bit PCM, roughly
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)  # All libsndfile's Opus encoder takes
+
+def to_pcm16(audio) -> List:
+    """
+    Normalize to a list of 1-D int16 chunks.
+    int16 input is passed through as-is; float input in [-1, 1] is converted.
+    """
+    import numpy as np
+
+    chunks = audio if isinstance(audio, (list, tuple)) else [audio]
+    return [
+        chunk.reshape(-1) if chunk.dtype == np.int16
+        else (np.clip(chunk.reshape(-1), -1.0, 1.0) * 32767).astype(np.int16)
+        for chunk in chunks
+    ]
+
+def payload_size(audio_file) -> int:
+    audio_file.seek(0, io.SEEK_END)
+    size = audio_file.tell()
+    audio_file.seek(0)
+    return size
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read-only file over a header plus memoryviews of the sample chunks.
+    Lets the HTTP client stream a WAV without assembling it in memory.
+    """
+    def __init__(self, header: bytes, chunks: List, name: str):
+        self.header, self.chunks = header, chunks
+        self.parts = [memoryview(header)] + [memoryview(c).cast('B') for c in chunks]
+        self.size = sum(len(p) for p in self.parts)
+        self.position = 0
+        self.name = name
+
+    def copy(self) -> 'ChunkReader':
+        return ChunkReader(self.header, self.chunks, self.name)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def readinto(self, target) -> int:
+        target = memoryview(target).cast('B')
+        written, offset = 0, 0
+        for part in self.parts:
+            if written == len(target) or self.position >= self.size:
+                break
+            if self.position < offset + len(part):
+                start = self.position - offset
+                n = min(len(part) - start, len(target) - written)
+                target[written:written + n] = part[start:start + n]
+                written += n
+                self.position += n
+            offset += len(part)
+        return written
+
+def reopen(audio_file) -> io.IOBase:
+    """
+    Independent file over the same encoded data, at position 0.
+    Each upload attempt (retries, hedged requests) reads its own copy.
+    """
+    if isinstance(audio_file, ChunkReader):
+        return audio_file.copy()
+    copy = io.BytesIO(audio_file.getvalue())
+    copy.name = audio_file.name
+    return copy
+
+class Encoder:
+    name = 'wav'
+    extension = 'wav'
+
+    def available(self) -> bool:
+        return True
+
+    def encode(self, chunks: List, sample_rate: int) -> io.RawIOBase:
+        # Canonical 44-byte PCM header; samples follow without copying
+        if sys.byteorder == 'big':
+            chunks = [chunk.byteswap() for chunk in chunks]
+        data = sum(chunk.nbytes for chunk in chunks)
+        header = struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', 36 + data, b'WAVE',
+            b'fmt ', 16, 1, 1, sample_rate, sample_rate * 2, 2, 16,
+            b'data', data
+        )
+        return ChunkReader(header, chunks, f"audio.{self.extension}")
+
+class SoundFileEncoder(Encoder):
+    format = ''
+    subtype = ''
+
+    def available(self) -> bool:
+        try:
+            import soundfile
+        except (ImportError, OSError):  # OSError: libsndfile missing
+            return False
+        return self.subtype in soundfile.available_subtypes(self.format)
+
+    def encode(self, chunks: List, sample_rate: int) -> io.RawIOBase:
+        # Into a temporary file, memory-mapped for the upload: an hour of
+        # FLAC would otherwise sit in memory next to the recording
+        import mmap
+        import tempfile
+        import soundfile
+
+        with tempfile.TemporaryFile() as spool:
+            with soundfile.SoundFile(spool, 'w', sample_rate, 1, self.subtype, format=self.format) as sf:
+                for chunk in chunks:
+                    sf.write(chunk)
+            spool.flush()
+            data = mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+        return ChunkReader(b'', [data], f"audio.{self.extension}")
+
+class FlacEncoder(SoundFileEncoder):
+    name = 'flac'
+    extension = 'flac'
+    format = 'FLAC'
+    subtype = 'PCM_16'
+
+class OpusEncoder(SoundFileEncoder):
+    name = 'opus'
+    extension = 'ogg'
+    format = 'OGG'
+    subtype = 'OPUS'
+
+ENCODERS: Dict[str, Encoder] = {e.name: e for e in (Encoder(), FlacEncoder(), OpusEncoder())}
+CHOICES = ['auto'] + list(ENCODERS)
+
+def get_encoder(name: Optional[str], duration: float, sample_rate: int = 16000) -> Encoder:
+    """
+    Resolve an encoder by name; 'auto' picks by recording length.
+    Encoding only starts after the recording stops, so auto prefers FLAC
+    (tens of ms per minute) and only uses Opus (seconds per minute on one
+    core) when a FLAC upload would likely go over the API limit.
+    Opus falls back to FLAC at sample rates it can't encode; unavailable
+    encoders fall back to WAV.
+    """
+    if not name or name == 'auto':
+        if duration < AUTO_FLAC_SECONDS:
+            name = 'wav'
+        elif duration * sample_rate * 2 * FLAC_RATIO <= UPLOAD_LIMIT:
+            name = 'flac'
+        else:
+            name = 'opus'
+    if name == 'opus' and sample_rate not in OPUS_RATES:
+        name = 'flac'
+    encoder = ENCODERS.get(name, ENCODERS['wav'])
+    return encoder if encoder.available() else ENCODERS['wav']
+
+_pool = None
+
+def encode_async(audio, sample_rate: int, name: Optional[str] = 'auto'):
+    """
+    Encode on a background thread so the caller can prepare the upload meanwhile.
+    Returns a Future of the encoded file.
+    """
+    global _pool
+    if _pool is None:
+        # Imported here: the CLI toggle path imports this module for its choices
+        import os
+        from concurrent.futures import ThreadPoolExecutor
+        # One recording uses one thread; streamed and batch segments use more
+        _pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix='encoder')
+    return _pool.submit(encode, audio, sample_rate, name)
+
+def encode(audio, sample_rate: int, name: Optional[str] = 'auto') -> io.IOBase:
+    chunks = to_pcm16(audio)
+    duration = sum(len(chunk) for chunk in chunks) / sample_rate
+    return get_encoder(name, duration, sample_rate).encode(chunks, sample_rate)
+
+def benchmark(audio, sample_rate: int) -> List[Dict]:
+    """
+    Size versus CPU time for every available encoder.
+    """
+    chunks = to_pcm16(audio)
+    raw = sum(chunk.nbytes for chunk in chunks)
+    results = []
+    for encoder in ENCODERS.values():
+        if not encoder.available():
+            continue
+        start = time.perf_counter()
+        size = payload_size(encoder.encode(chunks, sample_rate))
+        results.append({
+            'encoder': encoder.name,
+            'bytes': size,
+            'ratio': size / max(1, raw),
+            'seconds': time.perf_counter() - start,
+        })
+    return results
+
+if __name__ == '__main__':
+    # python -m whispaste.encoders recording.wav
+    import wave
+    import numpy as np
+
+    with wave.open(sys.argv[1], 'rb') as wf:
+        rate = wf.getframerate()
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    print(f"{len(pcm) / rate:.1f}s @ {rate} Hz")
+    for r in benchmark(pcm, rate):
+        print(f"{r['encoder']:>5}: {r['bytes'] / 1024:8.1f} KiB ({r['ratio']:.0%})  {r['seconds'] * 1000:7.1f} ms")
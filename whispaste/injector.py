@@ -1,93 +1,213 @@
 """
 Injector: Handles Input Simulation (Typing, Key Presses).
 """
-import platform
+import re
+import threading
 import time
+from typing import Iterable, Iterator, Optional
 from .system import System
-from .clipboard import Clipboard
+from .clipboard import Clipboard, Snapshot
+from .stats import Trace
+from . import backends, typer
 
 class Injector:
+    PASTE_DELAY = 0.1       # Settle time when the selection can't be read back
+    READY_TIMEOUT = 0.5     # Max wait for the selection owner to serve our text
+    RESTORE_DELAY = 0.2     # Let the target app fetch PRIMARY before restoring it
+    MIN_CHUNK = 24      # Characters to collect before pasting a partial sentence
+    SENTENCE_END = re.compile(r'[.!?:;\n]\s*$')
+
+    restore_thread: Optional[threading.Thread] = None
+
     @staticmethod
     def send_paste_signal() -> bool:
         """
         Simulate paste from PRIMARY selection (X11) or clipboard (other systems).
+        Wayland/X11 use Shift+Insert (or middle-click), macOS uses Cmd+V.
+        Windows: PowerShell is often too slow for realtime input injection,
+        so we mostly rely on the user manually pasting if they don't have tools.
         """
-        # 1. Wayland - Shift+Insert pastes from primary
-        if System.run(['wtype', '-M', 'shift', '-k', 'Insert', '-m', 'shift']): return True
-        
-        # 2. X11 - Shift+Insert and middle-click paste from PRIMARY selection
-        if System.run(['xdotool', 'key', 'shift+Insert']): return True
-        if System.run(['xdotool', 'click', '2']): return True
-        
-        # 3. MacOS - Cmd+V pastes from clipboard
-        if System.run(['osascript', '-e', 'tell application "System Events" to keystroke "v" using command down']): return True
-        
-        # 4. Windows - PowerShell is often too slow for realtime input injection,
-        # so we mostly rely on the user manually pasting if they don't have tools.
+        for cmd in backends.commands('paste'):
+            if System.run(cmd): return True
         return False
 
     @staticmethod
     def type_string(text: str) -> bool:
         """
-        Simulate typing the string character by character.
+        Simulate typing the string, in chunks that resume after a stall.
+        (wtype on Wayland, ydotool, xdotool on X11, osascript on macOS)
         """
-        # 1. Wayland
-        if System.run(['wtype', '--', text]): return True
-        
-        # 2. Linux Daemon (ydotool)
-        if System.run(['ydotool', 'type', '--', text]): return True
-        
-        # 3. X11
-        if System.run(['xdotool', 'type', '--clearmodifiers', '--', text]): return True
-        
-        # 4. MacOS
-        if System.run(['osascript', '-e', f'tell app "System Events" to keystroke "{text}"']): return True
-        
-        return False
+        return typer.type_text(text)
 
     @staticmethod
-    def insert(text: str):
+    def insert(text: str, trace: Optional[Trace] = None):
         """
         Smart Insertion: Backup -> Copy to PRIMARY -> Paste -> Restore -> Fallback to Type.
         Uses X11 PRIMARY selection for proper paste behavior.
+        Restoring happens in the background, after "Done!". The clipboard is
+        never written, so it is left alone (and keeps all its formats).
         """
-        # Step 1: Backup original clipboard and primary selection
-        original_clipboard = Clipboard.read_clipboard()
-        original_primary = Clipboard.read_primary()
+        trace = trace or Trace()
+        start = time.perf_counter()
+
+        # Step 1: Backup the primary selection
+        with trace.span('backup'):
+            original_primary = Injector.backup()
         
-        # Step 2: Put transcribed text in PRIMARY selection (X11 way)
-        if not Clipboard.write_primary(text):
-            System.notify("Failed to access primary selection.")
-            return
+        with trace.span('paste'):
+            # Step 2: Put transcribed text in PRIMARY selection (X11 way)
+            if not Clipboard.write_primary(text):
+                System.notify("Failed to access primary selection.")
+                trace.set('result', 'failed')
+                return
+
+            # Step 2.5: Wait until the selection owner actually serves the text
+            Injector.wait_ready(text)
 
-        # Step 2.5: Small delay to ensure selection operation completes (especially on X11)
-        time.sleep(0.1)
+            # Step 3: Try to trigger a paste action using PRIMARY selection
+            pasted = Injector.send_paste_signal()
 
-        # Step 3: Try to trigger a paste action using PRIMARY selection
-        if Injector.send_paste_signal():
-            # Restore original selections after successful paste
-            if original_primary:
-                Clipboard.write_primary(original_primary)
-            if original_clipboard:
-                Clipboard.write_clipboard(original_clipboard)
+        if pasted:
             System.notify("Done!")
+            System.log(f"Insert: pasted in {(time.perf_counter() - start) * 1000:.0f} ms")
+            trace.set('result', 'pasted')
+            # Restore the original selection after successful paste
+            Injector.restore_later(original_primary, trace)
             return
             
         # Step 4: Fallback to typing (slower but reliable if paste fails)
-        if Injector.type_string(text):
-            # Restore original selections after successful typing
-            if original_primary:
-                Clipboard.write_primary(original_primary)
-            if original_clipboard:
-                Clipboard.write_clipboard(original_clipboard)
+        with trace.span('paste'):
+            typed = Injector.type_string(text)
+        if typed:
             System.notify("Typed!")
+            System.log(f"Insert: typed in {(time.perf_counter() - start) * 1000:.0f} ms")
+            trace.set('result', 'typed')
+            # Restore the original selection after successful typing
+            Injector.restore_later(original_primary, trace)
             return
             
-        # Step 5: Give up on insertion, but still restore original selections
-        if original_primary:
-            Clipboard.write_primary(original_primary)
-        if original_clipboard:
-            Clipboard.write_clipboard(original_clipboard)
-            System.notify("Insertion failed, selections restored")
+        # Step 5: Give up on insertion, but still restore the original selection
+        trace.set('result', 'failed')
+        with trace.span('restore'):
+            Injector.restore(original_primary)
+        System.notify("Insertion failed")
+
+    @staticmethod
+    def backup() -> Optional[Snapshot]:
+        """
+        Snapshot the primary selection (raw bytes, original format), the only
+        one insertion overwrites.
+        """
+        # A restore still in flight would make us back up our own text
+        Injector.wait_restore()
+        return Clipboard.snapshot('primary')
+
+    @staticmethod
+    def wait_ready(text: str):
+        if backends.commands('read_primary'):
+            Clipboard.wait_primary(text, Injector.READY_TIMEOUT)
+        else:
+            time.sleep(Injector.PASTE_DELAY)
+
+    @staticmethod
+    def settle(pasted_at: float):
+        """
+        Give the target app RESTORE_DELAY after a paste to fetch PRIMARY
+        before it is overwritten (by the next chunk).
+        """
+        remaining = pasted_at + Injector.RESTORE_DELAY - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    @staticmethod
+    def restore(original_primary: Optional[Snapshot]):
+        Clipboard.restore_snapshot(original_primary, 'primary')
+
+    @staticmethod
+    def restore_later(original_primary: Optional[Snapshot], trace: Optional[Trace] = None):
+        """
+        Restore the primary selection off the critical path. The thread is not a
+        daemon thread, so a one-shot worker still finishes it before exiting.
+        """
+        trace = trace or Trace()
+
+        def run():
+            time.sleep(Injector.RESTORE_DELAY)
+            with trace.span('restore'):
+                Injector.restore(original_primary)
+
+        Injector.restore_thread = threading.Thread(target=run, name='restore')
+        Injector.restore_thread.start()
+
+    @staticmethod
+    def wait_restore():
+        if Injector.restore_thread is not None:
+            Injector.restore_thread.join()
+            Injector.restore_thread = None
+
+    @staticmethod
+    def group(pieces: Iterable[str]) -> Iterator[str]:
+        """
+        Regroup streamed tokens into whole words or sentences.
+        A sentence end flushes immediately; otherwise wait for MIN_CHUNK
+        characters and cut at the last whitespace.
+        """
+        pending = ''
+        for piece in pieces:
+            pending += piece
+            if Injector.SENTENCE_END.search(pending):
+                yield pending
+                pending = ''
+            elif len(pending) >= Injector.MIN_CHUNK:
+                cut = max(pending.rfind(' '), pending.rfind('\n'))
+                if cut > 0:
+                    yield pending[:cut]
+                    pending = pending[cut:]
+        if pending:
+            yield pending
+
+    @staticmethod
+    def insert_stream(pieces: Iterable[str], trace: Optional[Trace] = None) -> str:
+        """
+        Incremental Insertion: paste text as it is generated (word/sentence chunks).
+        PRIMARY is backed up once and restored at the end.
+        Returns everything that was produced (inserted or not).
+        """
+        trace = trace or Trace()
+        with trace.span('backup'):
+            original_primary = Injector.backup()
+
+        produced = []
+        typing = False   # Switch to typing for good once a paste fails
+        failed = False
+        pasted_at = None  # The paste is asynchronous: the app may not have fetched PRIMARY yet
+        for chunk in Injector.group(pieces):
+            produced.append(chunk)
+            if failed:
+                continue
+            if pasted_at is not None:
+                # Waiting on the app, not on us: part of 'refine', not 'paste'
+                Injector.settle(pasted_at)
+                pasted_at = None
+            with trace.span('paste'):
+                if not typing and Clipboard.write_primary(chunk):
+                    Injector.wait_ready(chunk)
+                    if Injector.send_paste_signal():
+                        pasted_at = time.monotonic()
+                        continue
+                typing = True
+                if not Injector.type_string(chunk):
+                    failed = True
+
+        text = ''.join(produced).strip()
+        if failed:
+            trace.set('result', 'failed')
+            with trace.span('restore'):
+                Injector.restore(original_primary)
+            System.notify("Insertion failed, selection restored")
         else:
-            System.notify("Insertion failed")
+            if text:
+                System.notify("Done!")
+            trace.set('result', 'typed' if typing else 'pasted')
+            Injector.restore_later(original_primary, trace)
+        return text
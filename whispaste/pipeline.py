@@ -0,0 +1,70 @@
+"""
+Pipeline: Sessions overlap but deliver in order.
+A new recording may start while earlier ones are still transcribing; their
+text must still reach the cursor in recording order. Each session takes a
+ticket (a file in the queue directory, named by start time) when recording
+starts and waits before delivering until every older ticket is gone.
+Files make this work across one-shot workers as well as inside the daemon.
+"""
+import itertools
+import os
+import time
+from pathlib import Path
+from typing import List
+from .config import CONFIG
+from .system import System
+
+_sequence = itertools.count()
+
+class Ticket:
+    POLL = 0.01             # Seconds between queue checks
+    WAIT_TIMEOUT = 300.0    # Deliver anyway if an older session hangs this long
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    @staticmethod
+    def take() -> 'Ticket':
+        """Join the end of the queue."""
+        queue = CONFIG.queue_dir
+        queue.mkdir(exist_ok=True)
+        path = queue / f"{time.time_ns():020d}-{os.getpid()}-{next(_sequence)}"
+        path.touch()
+        return Ticket(path)
+
+    def ahead(self) -> List[Path]:
+        """
+        Older tickets that are still pending. Tickets of processes that died
+        without releasing them are removed.
+        """
+        pending = []
+        try:
+            older = sorted(p for p in CONFIG.queue_dir.iterdir() if p.name < self.path.name)
+        except OSError:
+            return []
+        for path in older:
+            try:
+                pid = int(path.name.split('-')[1])
+            except (IndexError, ValueError):
+                continue
+            if pid == os.getpid() or System.is_running(pid):
+                pending.append(path)
+            else:
+                path.unlink(missing_ok=True)
+        return pending
+
+    def wait(self):
+        """Block until every older session has delivered (or given up)."""
+        deadline = time.monotonic() + self.WAIT_TIMEOUT
+        waited = False
+        while self.ahead():
+            if time.monotonic() >= deadline:
+                System.log(f"Queue: gave up waiting for older sessions after {self.WAIT_TIMEOUT:.0f}s")
+                return
+            if not waited:
+                System.log("Queue: waiting for an earlier session to deliver")
+                waited = True
+            time.sleep(self.POLL)
+
+    def release(self):
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,149 @@
+"""
+Retries: Deadlines, exponential backoff and hedged requests for API calls.
+Settings (environment or .env):
+- WHISPASTE_TIMEOUT: seconds per attempt (default 30)
+- WHISPASTE_RETRIES: extra attempts after a retryable error (default 2)
+- WHISPASTE_HEDGE:   off (default), auto (p95 of recent latencies) or seconds.
+                     A second identical request is sent when the first takes
+                     longer than this; whichever answers first wins.
+"""
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, TypeVar
+from .config import CONFIG
+from .system import System
+
+T = TypeVar('T')
+
+TIMEOUT = 30.0
+RETRIES = 2
+BACKOFF = 0.5       # First retry delay; doubles per attempt (with jitter)
+MAX_BACKOFF = 8.0
+HISTORY = 50        # Latencies kept per kind of call
+MIN_SAMPLES = 10    # Don't hedge on a p95 guessed from fewer calls
+
+def retryable(e: Exception) -> bool:
+    """
+    Worth another attempt: timeouts, dropped connections, 429 and 5xx.
+    (openai's exceptions carry status_code; connection errors don't.)
+    """
+    status = getattr(e, 'status_code', None)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(e, (TimeoutError, ConnectionError)) or type(e).__name__ in ('APIConnectionError', 'APITimeoutError')
+
+class Latency:
+    """
+    Recent latencies of one kind of call ('transcribe', 'refine'), seeded
+    from stats.jsonl so a fresh worker process can hedge too.
+    """
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.samples = deque(maxlen=HISTORY)
+        self.lock = threading.Lock()
+        self.seeded = False
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.samples.append(seconds)
+
+    def seed(self):
+        from . import stats
+        try:
+            records = stats.load(time.time() - 7 * 86400)
+        except Exception:
+            records = []
+        history = [
+            r['ms'][self.kind] / 1000 for r in records
+            if self.kind in r.get('ms', {})
+            # Local transcriptions never go through here
+            and (self.kind != 'transcribe' or r.get('backend') == 'openai')
+        ]
+        with self.lock:
+            self.samples.extendleft(reversed(history[-HISTORY:]))
+            self.seeded = True
+
+    def p95(self) -> Optional[float]:
+        if not self.seeded:
+            self.seed()
+        with self.lock:
+            if len(self.samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+LATENCY: Dict[str, Latency] = {}
+_pool = None
+
+def latency(kind: str) -> Latency:
+    if kind not in LATENCY:
+        LATENCY[kind] = Latency(kind)
+    return LATENCY[kind]
+
+def hedge_delay(kind: str) -> Optional[float]:
+    value = str(CONFIG.setting('hedge', 'off')).lower()
+    if value in ('', 'off', 'no', 'false', '0'):
+        return None
+    if value == 'auto':
+        return latency(kind).p95()
+    return float(value)
+
+def call(fn: Callable[[float], T], kind: str, hedge: bool = True) -> T:
+    """
+    Run fn(timeout), one API request with the given per-attempt timeout,
+    until it succeeds. Retryable errors are retried with exponential
+    backoff; anything else (and the last failure) is raised.
+    With hedging, fn may run twice at once, so it must not share state
+    between calls (e.g. give each call its own file object).
+    """
+    timeout = float(CONFIG.setting('timeout', TIMEOUT))
+    retries = int(CONFIG.setting('retries', RETRIES))
+    delay = hedge_delay(kind) if hedge else None
+
+    def timed(timeout):
+        start = time.perf_counter()
+        result = fn(timeout)
+        # Every request counts, including hedges that lost, so the p95 stays honest
+        latency(kind).add(time.perf_counter() - start)
+        return result
+
+    for attempt in range(retries + 1):
+        try:
+            if delay is None or delay >= timeout:
+                return timed(timeout)
+            return _hedged(timed, timeout, delay, kind)
+        except Exception as e:
+            if attempt == retries or not retryable(e):
+                raise
+            wait_for = min(MAX_BACKOFF, BACKOFF * 2 ** attempt) * random.uniform(0.5, 1.0)
+            System.log(f"{kind}: {e!r}; retry {attempt + 1}/{retries} in {wait_for:.1f}s")
+            time.sleep(wait_for)
+
+def _hedged(fn: Callable[[float], T], timeout: float, delay: float, kind: str) -> T:
+    """
+    Start fn; if it hasn't answered after delay, start it again and take the
+    first success. The loser finishes in the background and is ignored.
+    """
+    # Not at module level: this module is on the toggle's import path
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='hedge')
+
+    first = _pool.submit(fn, timeout)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    System.log(f"{kind}: no answer after {delay:.2f}s, sending a hedged request")
+    pending = {first, _pool.submit(fn, timeout)}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error
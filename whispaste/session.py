@@ -0,0 +1,214 @@
+"""
+Session: One dictation from capture to text at the cursor.
+Shared by the one-shot worker and the resident daemon.
+"""
+import threading
+import time
+from typing import Any, Dict
+from .config import CONFIG
+from .system import System
+from .clipboard import Clipboard
+from .injector import Injector
+from .streaming import SegmentStreamer
+from .stats import Trace
+from .pipeline import Ticket
+from . import cleanup, spool, vad
+from .vad import Endpointer
+
+class Session:
+    def __init__(self, engine, opts: Dict[str, Any]):
+        self.engine = engine
+        self.opts = opts
+        self.audio = None
+        self.backend = opts.get('backend') or CONFIG.setting('backend', 'openai')
+        self.trace = Trace(self.backend, opts.get('invoked'))
+        self.ticket = None  # Place in the delivery queue (see pipeline.py)
+        self.recording = None  # Spool file the audio is captured into (see spool.py)
+        # Streaming mode uploads segments while we are still recording
+        self.segments = None
+        if opts.get('stream'):
+            self.segments = SegmentStreamer(
+                engine,
+                trim=opts.get('vad', True),
+                encoder=opts.get('encoder', 'auto'),
+                backend=opts.get('backend')
+            )
+
+    def record(self, stop: threading.Event):
+        """
+        Capture audio until stop is set. With opts['auto_stop'] (seconds of
+        trailing silence) the endpointer sets it once the speaker is done.
+        Takes this session's place in the delivery queue, so its text goes
+        in after that of sessions recorded earlier.
+        """
+        self.ticket = Ticket.take()
+        self.recording = spool.Recording.create(self.engine.sample_rate, self.opts)
+        System.notify("Listening...")
+        if self.backend == 'openai' or self.opts.get('prompt'):
+            self.engine.preconnect(stop)
+
+        endpointer = None
+        if self.opts.get('auto_stop'):
+            endpointer = Endpointer(self.engine.sample_rate, float(self.opts['auto_stop']))
+
+        first_block = []
+        def on_block(block):
+            if not first_block:
+                first_block.append(time.perf_counter())
+                if self.trace.invoked:
+                    self.trace.add('hotkey', time.time() - self.trace.invoked)
+            if self.segments:
+                self.segments.feed(block)
+            if endpointer is not None and not stop.is_set() and endpointer.feed(block):
+                self.trace.set('stopped_by', 'endpoint')
+                stop.set()
+
+        try:
+            self.audio = self.engine.record_until_stop(
+                stop, on_block=on_block, allocate=self.recording and self.recording.allocate)
+        except BaseException:
+            self.ticket.release()
+            raise
+        self.trace.stop()
+        if self.recording is not None:
+            self.recording.finish(len(self.audio) if self.audio is not None else 0)
+        if first_block:
+            self.trace.add('capture', self.trace.stopped - first_block[0])
+        if self.audio is not None:
+            self.trace.set('audio', round(self.audio.duration, 2))
+            System.log(f"Captured {self.audio.duration:.1f}s of audio ({self.audio.nbytes / 2**20:.1f} MiB buffer)")
+
+    def replay(self, audio):
+        """Process audio recorded earlier (see spool.reprocess)."""
+        self.audio = audio
+        self.ticket = Ticket.take()
+        self.trace.set('replay', True)
+        self.trace.stop()
+        self.process()
+
+    def process(self):
+        """
+        Transcribe the captured audio and deliver the text (paste or clipboard).
+        The session's timings are written to stats.jsonl afterwards.
+        """
+        try:
+            self.deliver()
+        finally:
+            restore = Injector.restore_thread
+            if self.ticket is not None:
+                # The next session backs up PRIMARY (possibly in another
+                # process), so ours must be back in place before it may deliver
+                if restore is not None:
+                    restore.join()
+                self.ticket.release()
+            # The background restore is part of the record; wait for it off-thread
+            self.trace.finish(after=restore)
+
+    def deliver(self):
+        if self.audio is None:
+            System.notify("No audio recorded.")
+            return
+
+        chunks = self.audio.chunks()
+        if self.opts.get('vad', True) and self.segments is None:
+            chunks, removed = vad.trim_silence(chunks, self.engine.sample_rate)
+            System.log(f"VAD: removed {removed:.1f}s of silence")
+            if chunks is None:
+                System.notify("No speech detected.")
+                self.trace.set('result', 'no_speech')
+                return
+
+        prompt = self.opts.get('prompt')
+        clipboard = self.opts.get('clipboard', False)
+        # When typing into a window, stream the post-processing straight in
+        # instead of waiting for the whole completion
+        stream_refine = bool(prompt) and not clipboard
+        # The cleanup template is tried locally first (see cleanup.py)
+        local = self.opts.get('template') == 'cleanup'
+
+        text = self.transcript(chunks)
+        if text and local:
+            text, prompt = self.clean(text, prompt, refine=not stream_refine)
+            stream_refine = stream_refine and bool(prompt)
+        elif text and prompt and not stream_refine:
+            text = self.refine(text, prompt)
+        if not text:
+            self.trace.set('result', 'error')
+            return
+
+        # Earlier recordings that are still transcribing go first
+        if self.ticket is not None:
+            with self.trace.span('queue'):
+                self.ticket.wait()
+        if clipboard:
+            with self.trace.span('paste'):
+                copied = Clipboard.write(text)
+            self.trace.set('result', 'clipboard' if copied else 'failed')
+            System.notify("Copied to clipboard!" if copied else "Failed to copy.")
+        elif stream_refine:
+            with self.trace.span('refine'):
+                inserted = Injector.insert_stream(self.refined(text), self.trace)
+            if not inserted:
+                # Post-processing failed before producing anything
+                Injector.insert(text, self.trace)
+        else:
+            Injector.insert(text, self.trace)
+        self.trace.since_stop('latency')
+
+    def transcript(self, chunks):
+        """
+        The raw transcript, from the cache when this audio was transcribed
+        before (e.g. reprocessing it with another template).
+        """
+        key = spool.audio_key(self.audio.chunks(), self.engine.sample_rate, self.backend, self.opts.get('vad', True))
+        text = spool.cached_transcript(key)
+        if text is not None:
+            System.log("Transcript: cached, skipping the upload")
+            self.trace.set('cached', True)
+            return text
+
+        text = self.engine.transcribe(
+            chunks,
+            segments=self.segments,
+            encoder=self.opts.get('encoder', 'auto'),
+            backend=self.backend,
+            trace=self.trace
+        )
+        self.trace.set('encoder', self.opts.get('encoder', 'auto'))
+        if text:
+            spool.cache_transcript(key, text)
+        return text
+
+    def refine(self, text, prompt):
+        """Post-processing in one piece; None (and a notification) on errors."""
+        try:
+            with self.trace.span('refine'):
+                return self.engine.refine(text, prompt, self.opts.get('model'))
+        except Exception as e:
+            System.notify(f"API Error: {str(e)}")
+            System.log(f"API Error: {e}")
+            return None
+
+    def clean(self, text, prompt, refine=True):
+        """
+        Local cleanup; the model only gets the text if cleanup.needs_llm()
+        says so (streamed by the caller unless refine). Returns the text and
+        the prompt that is still to run.
+        """
+        with self.trace.span('refine'):
+            text, prompt = cleanup.apply(text, prompt)
+        self.trace.set('cleanup', 'llm' if prompt else 'local')
+        if prompt and refine:
+            # The local result is still better than nothing
+            text, prompt = self.refine(text, prompt) or text, None
+        return text, prompt
+
+    def refined(self, text):
+        """
+        Streamed post-processing; API errors end the stream instead of raising.
+        """
+        try:
+            yield from self.engine.refine_stream(text, self.opts.get('prompt'), self.opts.get('model'))
+        except Exception as e:
+            System.notify(f"API Error: {str(e)}")
+            System.log(f"API Error: {e}")
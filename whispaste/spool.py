@@ -0,0 +1,197 @@
+"""
+Spool: Recordings on disk, so a failed or unwanted result isn't lost.
+Capture writes straight into memory-mapped files in the config dir (the
+BlockBuffer's allocate hook), so the audio survives the worker crashing or
+the API failing. `--retry-last` runs the last recording again with its
+original options; `--reprocess-last -t email` with new ones.
+Raw transcripts are cached by a hash of the audio, so re-templating a
+recording only runs the chat step.
+
+Settings (environment or .env):
+- WHISPASTE_SPOOL_KEEP:   recordings kept, least recently used go first (default 10, 0 = off)
+- WHISPASTE_SPOOL_MAX_MB: total size kept (default 256)
+"""
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from .config import CONFIG
+from .system import System
+
+KEEP = 10
+MAX_MB = 256
+CACHE_KEEP = 100    # Cached transcripts
+
+class Recording:
+    """
+    <stamp>.pcm (int16 mono samples, blocks appended as they are allocated)
+    and <stamp>.json (sample rate, session options, samples once finished).
+    """
+    def __init__(self, path: Path):
+        self.path = path            # Without suffix
+        self.pcm = path.with_suffix('.pcm')
+        self.info = path.with_suffix('.json')
+        self.size = 0               # Samples allocated so far
+
+    @staticmethod
+    def create(sample_rate: int, opts: Dict[str, Any]) -> Optional['Recording']:
+        """A new spool file, or None when spooling is off or impossible."""
+        if int(CONFIG.setting('spool_keep', KEEP)) <= 0:
+            return None
+        try:
+            CONFIG.spool_dir.mkdir(exist_ok=True)
+            recording = Recording(CONFIG.spool_dir / f"{time.time_ns():020d}-{os.getpid()}")
+            recording.pcm.touch()
+            recording.write_info({'sample_rate': sample_rate, 'opts': opts, 'samples': None})
+            return recording
+        except OSError as e:
+            System.log(f"Spool: can't create a recording file: {e}")
+            return None
+
+    def allocate(self, samples: int):
+        """
+        BlockBuffer allocate hook: grow the file and map the new block.
+        Falls back to memory if the disk is full.
+        """
+        import numpy as np
+
+        offset = self.size * 2
+        try:
+            os.truncate(self.pcm, offset + samples * 2)
+            block = np.memmap(self.pcm, dtype=np.int16, mode='r+', offset=offset, shape=(samples,))
+        except (OSError, ValueError) as e:
+            System.log(f"Spool: {e}; keeping the rest in memory")
+            return np.zeros(samples, dtype=np.int16)
+        self.size += samples
+        return block
+
+    def read_info(self) -> Dict[str, Any]:
+        return json.loads(self.info.read_text())
+
+    def write_info(self, info: Dict[str, Any]):
+        temp = self.info.with_suffix('.tmp')
+        temp.write_text(json.dumps(info))
+        os.replace(temp, self.info)
+
+    def finish(self, samples: int):
+        """Record the real length (the file ends in the unused tail of the last block)."""
+        try:
+            if not samples:
+                self.discard()
+                return
+            self.write_info({**self.read_info(), 'samples': samples})
+        except (OSError, ValueError) as e:
+            System.log(f"Spool: {e}")
+        evict()
+
+    def discard(self):
+        self.pcm.unlink(missing_ok=True)
+        self.info.unlink(missing_ok=True)
+
+    def load(self):
+        """The audio as a BlockBuffer over the (read-only) file, or None."""
+        import numpy as np
+        from .buffer import BlockBuffer
+
+        info = self.read_info()
+        # A worker that died while recording never wrote the length;
+        # the tail is then the silence of the unused block
+        samples = info.get('samples') or self.pcm.stat().st_size // 2
+        if not samples:
+            return None
+        buffer = BlockBuffer(info['sample_rate'])
+        buffer.blocks = [np.memmap(self.pcm, dtype=np.int16, mode='r', shape=(samples,))]
+        buffer.fill = buffer.length = samples
+        return buffer
+
+    def touch(self):
+        """Mark as used (eviction is least recently used first)."""
+        try:
+            os.utime(self.info)
+        except OSError:
+            pass
+
+def recordings() -> List[Recording]:
+    """Spooled recordings, oldest first."""
+    try:
+        return [Recording(path.with_suffix('')) for path in sorted(CONFIG.spool_dir.glob('*.json'))]
+    except OSError:
+        return []
+
+def latest() -> Optional[Recording]:
+    found = recordings()
+    return found[-1] if found else None
+
+def evict():
+    """Drop least recently used recordings beyond WHISPASTE_SPOOL_KEEP / _MAX_MB."""
+    keep = int(CONFIG.setting('spool_keep', KEEP))
+    max_bytes = float(CONFIG.setting('spool_max_mb', MAX_MB)) * 2**20
+    entries = []
+    for recording in recordings():
+        try:
+            entries.append((recording.info.stat().st_mtime, recording.pcm.stat().st_size, recording))
+        except OSError:
+            continue
+    entries.sort(key=lambda entry: entry[0], reverse=True)
+    total = 0
+    for index, (_, size, recording) in enumerate(entries):
+        total += size
+        # The most recent one stays, however big
+        if index and (index >= keep or total > max_bytes):
+            recording.discard()
+
+def audio_key(chunks, sample_rate: int, backend: str, vad: bool) -> str:
+    """Content hash of the recording plus what else decides its transcript."""
+    digest = hashlib.blake2b(f"{sample_rate}:{backend}:{vad}".encode(), digest_size=16)
+    for chunk in chunks:
+        digest.update(memoryview(chunk).cast('B'))
+    return digest.hexdigest()
+
+def cached_transcript(key: str) -> Optional[str]:
+    path = CONFIG.spool_dir / 'transcripts' / f"{key}.txt"
+    try:
+        text = path.read_text()
+        os.utime(path)
+        return text
+    except OSError:
+        return None
+
+def cache_transcript(key: str, text: str):
+    cache = CONFIG.spool_dir / 'transcripts'
+    try:
+        cache.mkdir(parents=True, exist_ok=True)
+        (cache / f"{key}.txt").write_text(text)
+        entries = sorted(cache.glob('*.txt'), key=lambda path: path.stat().st_mtime)
+        for path in entries[:-CACHE_KEEP]:
+            path.unlink(missing_ok=True)
+    except OSError as e:
+        System.log(f"Spool: can't cache transcript: {e}")
+
+def reprocess(opts: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Transcribe and deliver the last recording again, with its original
+    options or opts. Returns the exit code.
+    """
+    recording = latest()
+    audio = None
+    try:
+        if recording is not None:
+            info = recording.read_info()
+            audio = recording.load()
+    except (OSError, ValueError) as e:
+        System.log(f"Spool: can't read {recording.path}: {e}")
+    if audio is None:
+        System.notify("No recording to reprocess.")
+        return 1
+
+    from .audio import AudioEngine
+    from .session import Session
+
+    recording.touch()
+    # Segments were only ever streamed during capture
+    opts = {**(opts or info['opts']), 'stream': False, 'invoked': None}
+    session = Session(AudioEngine(info['sample_rate']), opts)
+    session.replay(audio)
+    return 0 if session.trace.meta.get('result') not in ('error', 'failed') else 1
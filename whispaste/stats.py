@@ -0,0 +1,149 @@
+"""
+Stats: Per-phase latency of every session, one JSON line each in stats.jsonl.
+`whispaste stats` reports p50/p95/p99 per phase and backend.
+
+Phases (milliseconds):
+- hotkey:     CLI invocation -> first captured audio block
+- capture:    first block -> stop
+- encode:     stop -> upload file ready
+- transcribe: upload and transcription (includes waiting for encode/streamed segments)
+- queue:      waiting for earlier sessions to deliver first
+- refine:     post-processing (streamed: until the last chunk is inserted)
+- backup:     primary selection snapshot before inserting
+- paste:      selection write + paste (or typing)
+- restore:    putting the selection back (after "Done!")
+- latency:    stop -> text delivered, what the user waits for
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from .config import CONFIG
+from .system import Appender
+
+PHASES = ['hotkey', 'capture', 'encode', 'transcribe', 'queue', 'refine', 'backup', 'paste', 'restore', 'latency']
+MAX_BYTES = 1024 * 1024
+KEEP = 3
+
+STATS = Appender(lambda: CONFIG.stats_file, max_bytes=MAX_BYTES, keep=KEEP)
+
+class Trace:
+    """
+    Timings of one session. Spans of the same phase add up (e.g. several
+    pasted chunks). Nothing is written until finish().
+    """
+    def __init__(self, backend: Optional[str] = None, invoked: Optional[float] = None):
+        self.invoked = invoked      # Wall-clock time of the CLI toggle, if known
+        self.stopped: Optional[float] = None  # perf_counter() when capture stopped
+        self.phases: Dict[str, float] = {}
+        self.meta: Dict[str, Any] = {'backend': backend}
+        self.lock = threading.Lock()
+        self.done = False
+
+    def add(self, phase: str, seconds: float):
+        with self.lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def span(self, phase: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(phase, time.perf_counter() - start)
+
+    def set(self, key: str, value: Any):
+        self.meta[key] = value
+
+    def stop(self):
+        """Mark the end of capture; later phases are measured from here."""
+        self.stopped = time.perf_counter()
+
+    def since_stop(self, phase: str):
+        if self.stopped is not None:
+            self.add(phase, time.perf_counter() - self.stopped)
+
+    def finish(self, after: Optional[threading.Thread] = None):
+        """
+        Append the record to stats.jsonl. With after, wait for that thread
+        (the background restore) first, off the caller's thread.
+        """
+        if after is not None and after.is_alive():
+            threading.Thread(target=lambda: (after.join(), self.finish()), name='stats').start()
+            return
+        with self.lock:
+            if self.done:
+                return
+            self.done = True
+            record = {
+                'time': round(time.time(), 3),
+                **self.meta,
+                'ms': {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            }
+        try:
+            STATS.write(json.dumps(record) + '\n')
+        except OSError:
+            pass
+
+def load(since: float = 0.0) -> List[Dict[str, Any]]:
+    """Records newer than since (epoch seconds), oldest rotated file first."""
+    path = CONFIG.stats_file
+    STATS.flush()
+    files = [path.with_name(f"{path.name}.{index}") for index in range(KEEP, 0, -1)] + [path]
+    records = []
+    for file in files:
+        try:
+            lines = file.read_text().splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # Torn line from a crashed process
+            if record.get('time', 0) >= since:
+                records.append(record)
+    return records
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+def parse_window(text: str) -> float:
+    """'30m', '24h', '7d' (or plain seconds) -> seconds."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    if text and text[-1] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+def summarize(records: List[Dict[str, Any]]) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """backend -> phase -> {n, p50, p95, p99} in milliseconds."""
+    samples: Dict[str, Dict[str, List[float]]] = {}
+    for record in records:
+        backend = record.get('backend') or 'openai'
+        for phase, ms in record.get('ms', {}).items():
+            samples.setdefault(backend, {}).setdefault(phase, []).append(ms)
+
+    order = {phase: index for index, phase in enumerate(PHASES)}
+    summary = {}
+    for backend, phases in sorted(samples.items()):
+        summary[backend] = {
+            phase: {'n': len(values), **{f'p{p}': percentile(values, p) for p in (50, 95, 99)}}
+            for phase, values in sorted(phases.items(), key=lambda item: order.get(item[0], len(order)))
+        }
+    return summary
+
+def report(window: str = '7d') -> str:
+    since = time.time() - parse_window(window)
+    records = load(since)
+    if not records:
+        return f"No sessions recorded in the last {window} ({CONFIG.stats_file})"
+    lines = [f"{len(records)} sessions in the last {window}"]
+    for backend, phases in summarize(records).items():
+        lines.append(f"\n{backend:<12}{'n':>6}{'p50':>9}{'p95':>9}{'p99':>9}  ms")
+        for phase, row in phases.items():
+            lines.append(f"  {phase:<10}{row['n']:>6}{row['p50']:>9.0f}{row['p95']:>9.0f}{row['p99']:>9.0f}")
+    return '\n'.join(lines)
@@ -0,0 +1,84 @@
+"""
+Streaming Transcription: Upload finished segments while recording continues.
+The capture is cut at natural pauses; after stop only the tail is still
+waiting on the network.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from .system import System
+from . import vad
+
+class SegmentStreamer:
+    PAUSE_SECONDS = 0.6     # Silence that counts as a natural pause
+    MIN_SEGMENT = 5.0       # Don't cut shorter segments (each costs a round trip)
+    MAX_SEGMENT = 60.0      # Cut even without a pause
+    SILENCE_RMS = 328       # ~-40 dBFS in int16 units
+
+    def __init__(self, engine, workers=2, trim=True, encoder='auto', backend=None):
+        self.engine = engine
+        self.trim = trim
+        self.encoder = encoder
+        self.backend = backend
+        self.sample_rate = engine.sample_rate
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.buffer = None      # This recording's capture buffer
+        self.futures = []
+        self.start = 0          # First sample of the open segment
+        self.position = 0       # Samples captured so far
+        self.silent_frames = 0
+        self.voiced = False
+
+    def feed(self, block):
+        """
+        Called from the audio callback with every captured block (already
+        stored in engine.buffer). Only bookkeeping happens here; trimming,
+        encoding and upload run in the pool.
+        """
+        import numpy as np
+
+        if self.buffer is None:
+            # Bind now: once this recording stops, engine.buffer may already
+            # belong to the next one
+            self.buffer = self.engine.buffer
+        self.position += len(block)
+        if np.sqrt(np.mean(np.square(block, dtype=np.float32))) < self.SILENCE_RMS:
+            self.silent_frames += len(block)
+        else:
+            self.silent_frames = 0
+            self.voiced = True
+
+        duration = (self.position - self.start) / self.sample_rate
+        paused = self.silent_frames >= self.PAUSE_SECONDS * self.sample_rate
+        if (duration >= self.MIN_SEGMENT and paused) or duration >= self.MAX_SEGMENT:
+            self.cut()
+
+    def cut(self):
+        """
+        Close the current segment and start uploading it.
+        Segments without any speech are dropped.
+        """
+        start, end, voiced = self.start, self.position, self.voiced
+        self.start, self.silent_frames, self.voiced = end, 0, False
+        if end > start and voiced and self.buffer is not None:
+            # Zero-copy views; the capture buffer never moves written samples
+            chunks = self.buffer.chunks(start, end)
+            self.futures.append(self.pool.submit(self._transcribe_chunks, chunks))
+
+    def _transcribe_chunks(self, chunks) -> str:
+        if self.trim:
+            chunks, removed = vad.trim_silence(chunks, self.sample_rate)
+            System.log(f"VAD: removed {removed:.1f}s of silence from segment")
+            if chunks is None:
+                return ''
+        return self.engine.transcribe_audio(chunks, self.encoder, self.backend)
+
+    def collect(self) -> str:
+        """
+        Flush the last segment and stitch all transcripts in capture order.
+        Call only after recording has stopped. Raises on API errors.
+        """
+        self.cut()
+        try:
+            texts = [future.result() for future in self.futures]
+        finally:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+        return ' '.join(text for text in texts if text)
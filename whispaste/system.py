@@ -6,21 +6,24 @@ import platform
 import signal
 import os
 import shutil
-from typing import List, Optional
+import threading
+import atexit
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Union
 from .config import CONFIG
 
 class System:
     @staticmethod
     def log(msg: str):
         try:
-            with open(CONFIG.log_file, 'a') as f:
-                f.write(f"{msg}\n")
+            LOG.write(f"{msg}\n")
         except: pass
 
     @staticmethod
-    def run(cmd: List[str], input_text: Optional[str] = None) -> bool:
+    def run(cmd: List[str], input_text: Optional[Union[str, bytes]] = None, timeout: float = 5) -> bool:
         """
-        Robust subprocess wrapper.
+        Robust subprocess wrapper. input_text may be str or raw bytes.
         """
         # Check if binary exists first to avoid FileNotFoundError being raised
         # strictly speaking subprocess.run raises it, but checking shutil.which is cleaner
@@ -30,9 +33,9 @@ class System:
         try:
             subprocess.run(
                 cmd,
-                input=input_text.encode() if input_text else None,
+                input=input_text.encode() if isinstance(input_text, str) else input_text,
                 check=True,
-                timeout=5,
+                timeout=timeout,
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL
             )
@@ -43,7 +46,15 @@ class System:
     @staticmethod
     def notify(msg: str):
         """
-        Send a desktop notification.
+        Send a desktop notification. Never blocks: delivery happens on a
+        background thread, and a message still waiting there is replaced.
+        """
+        NOTIFIER.send(msg)
+
+    @staticmethod
+    def show_notification(msg: str):
+        """
+        Deliver a notification synchronously (see Notifier).
         """
         system = platform.system()
         if system == 'Linux':
@@ -87,3 +98,173 @@ class System:
             else:
                 os.kill(pid, signal.SIGTERM)
         except: pass
+
+class Notifier:
+    """
+    Notification dispatcher: one background thread, one pending slot.
+    A message not yet shown is superseded by the next one ("Transcribing..."
+    is pointless once "Refining text..." is due). On Linux it talks to
+    org.freedesktop.Notifications over a persistent D-Bus connection (jeepney),
+    falling back to notify-send.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending: Optional[str] = None
+        self.busy = False
+        self.thread: Optional[threading.Thread] = None
+        self.bus = None
+        self.bus_failed = False
+        self.notification_id = 0  # Replaced in place, like notify-send -r
+
+    def send(self, msg: str):
+        with self.cond:
+            self.pending = msg
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='notifier', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush)
+            self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                msg, self.pending, self.busy = self.pending, None, True
+            try:
+                self.deliver(msg)
+            except Exception as e:
+                System.log(f"Notification failed: {e}")
+            with self.cond:
+                self.busy = False
+                self.cond.notify_all()
+
+    def flush(self, timeout: float = 2.0):
+        """Wait until everything queued has been shown (called at exit)."""
+        with self.cond:
+            self.cond.wait_for(lambda: self.pending is None and not self.busy, timeout)
+
+    def deliver(self, msg: str):
+        if platform.system() == 'Linux' and self.notify_dbus(msg):
+            return
+        System.show_notification(msg)
+
+    def notify_dbus(self, msg: str) -> bool:
+        if self.bus_failed:
+            return False
+        try:
+            from jeepney import DBusAddress, new_method_call
+            from jeepney.io.blocking import open_dbus_connection
+        except ImportError:
+            self.bus_failed = True
+            return False
+        try:
+            if self.bus is None:
+                self.bus = open_dbus_connection(bus='SESSION')
+            address = DBusAddress(
+                '/org/freedesktop/Notifications',
+                bus_name='org.freedesktop.Notifications',
+                interface='org.freedesktop.Notifications'
+            )
+            call = new_method_call(address, 'Notify', 'susssasa{sv}i', (
+                'whispaste', self.notification_id, '', 'whispaste', msg, [],
+                {'x-dunst-stack-tag': ('s', 'whispaste')}, -1
+            ))
+            reply = self.bus.send_and_get_reply(call, timeout=1)
+            self.notification_id = reply.body[0]
+            return True
+        except Exception as e:
+            # Bus went away (or never existed); reconnect on the next message
+            System.log(f"D-Bus notification failed: {e}")
+            self.bus = None
+            return False
+
+class Appender:
+    """
+    Append-only text file that stays open between writes.
+    Writes are buffered and flushed within FLUSH_INTERVAL seconds (by a
+    timer, so the last lines before a crash aren't left in memory) and at
+    exit. Several processes append to the same file, so rotation goes by
+    its size on disk: past max_bytes it is rotated to .1 ... .keep, and a
+    process whose file was rotated by another one reopens the path.
+    """
+    FLUSH_INTERVAL = 1.0
+
+    def __init__(self, get_path: Callable[[], Path], max_bytes: int, keep: int = 1):
+        self.get_path = get_path
+        self.max_bytes = max_bytes
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.file = None
+        self.path: Optional[Path] = None
+        self.unflushed = 0
+        self.flushed = 0.0
+        self.timer: Optional[threading.Timer] = None
+        self.registered = False
+
+    def write(self, text: str):
+        with self.lock:
+            path = self.get_path()
+            if self.file is None or path != self.path:
+                self._open(path)
+            self.file.write(text)
+            self.unflushed += len(text)
+            if self.unflushed >= self.max_bytes or time.monotonic() - self.flushed >= self.FLUSH_INTERVAL:
+                self._flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.FLUSH_INTERVAL, self._flush_later)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush_later(self):
+        with self.lock:
+            self.timer = None
+            self._flush()
+
+    def _open(self, path: Path):
+        self._close()
+        self.file = open(path, 'a')
+        self.path = path
+        self.flushed = time.monotonic()
+        if not self.registered:
+            atexit.register(self.flush)
+            self.registered = True
+
+    def _flush(self):
+        self.flushed = time.monotonic()
+        if self.file is None or not self.unflushed:
+            return
+        self.file.flush()
+        self.unflushed = 0
+        try:
+            on_disk = os.stat(self.path)
+        except OSError:
+            on_disk = None
+        if on_disk is None or on_disk.st_ino != os.fstat(self.file.fileno()).st_ino:
+            self._open(self.path)  # Rotated (or removed) by another process
+        elif on_disk.st_size >= self.max_bytes:
+            self._rotate()
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+        self.file = None
+
+    def _rotate(self):
+        self._close()
+        path = self.path
+        try:
+            for index in range(self.keep - 1, 0, -1):
+                older = path.with_name(f"{path.name}.{index}")
+                if older.exists():
+                    older.replace(path.with_name(f"{path.name}.{index + 1}"))
+            path.replace(path.with_name(f"{path.name}.1"))
+        except FileNotFoundError:
+            pass  # Another process rotated it first
+
+NOTIFIER = Notifier()
+LOG = Appender(lambda: CONFIG.log_file, max_bytes=1024 * 1024)
@@ -0,0 +1,161 @@
+"""
+Toggle: One recorder at a time, however fast the hotkey is pressed.
+Every press and every worker transition runs under an exclusive flock on
+toggle.lock and goes through state.json:
+
+    idle/processing --press--> recording   (worker spawned; "ready" once registered)
+    recording       --press--> processing  (SIGTERM if ready, else a stop request)
+    recording       --capture over--> processing --delivered--> idle
+
+Presses within WHISPASTE_DEBOUNCE_MS (default 250; environment only, as
+the press path doesn't load .env) of the last one are ignored. The CLI
+records the worker's PID itself at spawn time, so a second press can never
+start a second recorder or signal one that hasn't set up its signal
+handling yet. A registered worker holds recorder.lock
+while it captures: the kernel drops it when the process dies, so a crash is
+noticed without trusting a PID that may have been reused since.
+Processing doesn't block the next recording (see pipeline.py).
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, TextIO
+from .config import CONFIG
+from .system import System
+
+try:
+    import fcntl
+except ImportError:  # Windows: no locking (PID checks only)
+    fcntl = None
+
+DEBOUNCE_MS = 250
+SPAWNED = 'WHISPASTE_SPAWNED'  # Set in the environment of workers started by press()
+STARTUP_TIMEOUT = 10.0  # A worker that hasn't registered by then is presumed dead
+
+_recorder: Optional[TextIO] = None  # This worker's hold on recorder.lock
+
+def _lock(path: Path, blocking: bool = True) -> Optional[TextIO]:
+    """path opened with an exclusive flock (released on close); None if held and not blocking."""
+    f = open(path, 'a+')
+    if fcntl is not None:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            f.close()
+            return None
+    return f
+
+def read_state() -> Dict[str, Any]:
+    try:
+        return json.loads(CONFIG.state_file.read_text())
+    except (OSError, ValueError):
+        return {'state': 'idle'}
+
+@contextmanager
+def transaction() -> Iterator[Dict[str, Any]]:
+    """state.json, read and (if changed) written back under toggle.lock."""
+    with _lock(CONFIG.lock_file):
+        state = read_state()
+        before = dict(state)
+        yield state
+        if state != before:
+            temp = CONFIG.state_file.with_suffix('.tmp')
+            temp.write_text(json.dumps(state))
+            os.replace(temp, CONFIG.state_file)
+
+def debounce() -> float:
+    # Not CONFIG.setting(): that would import dotenv and parse .env on every press
+    return float(os.environ.get('WHISPASTE_DEBOUNCE_MS', DEBOUNCE_MS)) / 1000
+
+def recorder_alive(state: Dict[str, Any]) -> bool:
+    pid = state.get('pid')
+    if not pid:
+        return False
+    if not state.get('ready'):
+        return time.time() - state.get('started', 0) < STARTUP_TIMEOUT and System.is_running(pid)
+    if fcntl is None:
+        return System.is_running(pid)
+    probe = _lock(CONFIG.recorder_lock, blocking=False)
+    if probe is None:
+        return True
+    probe.close()
+    return False
+
+def press(spawn: Callable[[], int], opts: Dict[str, Any]) -> str:
+    """
+    One hotkey press from the CLI: 'start' (spawn() launched a worker with
+    SPAWNED in its environment and returned its PID), 'stop' or 'debounced'.
+    """
+    with transaction() as state:
+        now = time.time()
+        if now - state.get('pressed', 0) < debounce():
+            return 'debounced'
+        state['pressed'] = now
+
+        if state.get('state') == 'recording' and not recorder_alive(state):
+            System.log(f"Toggle: recorder {state.get('pid')} is gone")
+            state['state'] = 'idle'
+
+        if state.get('state') == 'recording':
+            if state.get('ready'):
+                System.kill(state['pid'])
+            else:
+                state['stop_requested'] = True  # Seen by register()
+            state['state'] = 'processing'
+            return 'stop'
+
+        pid = spawn()
+        state.update(state='recording', pid=pid, ready=False, started=now, stop_requested=False, opts=opts)
+        return 'start'
+
+def register() -> Optional[Dict[str, Any]]:
+    """
+    Worker side: wait for the previous capture to end, then mark this worker
+    as the ready recorder. Returns the options the CLI left for it, or None
+    if it was stopped or replaced before it got this far.
+    A worker started by hand (not by press()) takes over an idle state.
+    """
+    global _recorder
+    pid = os.getpid()
+    spawned = os.environ.pop(SPAWNED, None) is not None
+
+    def claimed(state) -> bool:
+        if state.get('pid') == pid:
+            return not state.get('stop_requested')
+        if spawned or (state.get('state') == 'recording' and recorder_alive(state)):
+            return False  # A newer press took over, or someone else is recording
+        state.update(state='recording', pid=pid, ready=False, started=time.time(), stop_requested=False, opts={})
+        return True
+
+    with transaction() as state:
+        if not claimed(state):
+            return None
+    _recorder = _lock(CONFIG.recorder_lock)
+    with transaction() as state:
+        if not claimed(state):
+            release()
+            return None
+        state['ready'] = True
+        return state.get('opts') or {}
+
+def captured():
+    """Worker side: capture is over; the next recorder may start."""
+    with transaction() as state:
+        if state.get('pid') == os.getpid() and state.get('state') == 'recording':
+            state['state'] = 'processing'  # Ended by auto-stop rather than a press
+    release()
+
+def finished():
+    """Worker side: the text is delivered (or the session failed)."""
+    with transaction() as state:
+        if state.get('pid') == os.getpid() and state.get('state') in ('recording', 'processing'):
+            state['state'] = 'idle'
+    release()
+
+def release():
+    global _recorder
+    if _recorder is not None:
+        _recorder.close()
+        _recorder = None
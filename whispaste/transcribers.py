@@ -0,0 +1,113 @@
+"""
+Transcribers: Speech-to-text backends behind one interface.
+- openai: hosted gpt-4o-mini-transcribe (default)
+- local:  faster-whisper on the CPU with int8 weights (optional dependency)
+"""
+import os
+from typing import Callable, Dict, List, Optional
+from .config import CONFIG
+from . import encoders
+from . import retry
+
+class Transcriber:
+    name = ''
+
+    def warm_up(self):
+        """Load whatever is slow to load. Called once by the resident daemon."""
+
+    def prepare(self, chunks: List, sample_rate: int, encoder: Optional[str] = 'auto'):
+        """
+        Start turning audio into the backend's input (may run in the background).
+        The result is passed to transcribe().
+        """
+        return chunks
+
+    def transcribe(self, payload, sample_rate: int) -> str:
+        """One transcription. Raises on errors."""
+        raise NotImplementedError
+
+class OpenAITranscriber(Transcriber):
+    name = 'openai'
+    MODEL = 'gpt-4o-mini-transcribe'  # Using the optimized model
+
+    def __init__(self, get_client: Callable):
+        self.get_client = get_client
+
+    def warm_up(self):
+        self.get_client()
+
+    def prepare(self, chunks, sample_rate, encoder='auto'):
+        return encoders.encode_async(chunks, sample_rate, encoder)
+
+    def transcribe(self, payload, sample_rate) -> str:
+        client = self.get_client()
+        if client is None:
+            raise RuntimeError("OPENAI_API_KEY not found")
+        audio_file = payload.result() if hasattr(payload, 'result') else payload  # Future from prepare()
+
+        def attempt(timeout):
+            transcript = client.audio.transcriptions.create(
+                model=self.MODEL,
+                file=encoders.reopen(audio_file),  # Retries/hedges each read their own copy
+                response_format='text',
+                timeout=timeout
+            )
+            return str(transcript).strip()
+
+        return retry.call(attempt, 'transcribe')
+
+class LocalTranscriber(Transcriber):
+    """
+    Offline transcription with faster-whisper (CTranslate2, int8 on CPU).
+    Model and thread count come from WHISPASTE_LOCAL_MODEL / WHISPASTE_THREADS.
+    """
+    name = 'local'
+    SAMPLE_RATE = 16000  # What Whisper models expect
+
+    def __init__(self, model: Optional[str] = None, threads: Optional[int] = None):
+        self.model_name = model or CONFIG.setting('local_model', 'base')
+        self.threads = threads or int(CONFIG.setting('threads', 0) or 0) or os.cpu_count() or 4
+        self.model = None
+
+    def load(self):
+        if self.model is None:
+            try:
+                from faster_whisper import WhisperModel
+            except ImportError:
+                raise RuntimeError("Local backend needs faster-whisper (pip install whispaste[local])")
+            self.model = WhisperModel(
+                self.model_name,
+                device='cpu',
+                compute_type='int8',
+                cpu_threads=self.threads,
+                num_workers=2  # Streamed segments may run concurrently
+            )
+        return self.model
+
+    def warm_up(self):
+        # First inference allocates buffers; do it on a second of silence
+        import numpy as np
+        model = self.load()
+        segments, _ = model.transcribe(np.zeros(self.SAMPLE_RATE, dtype=np.float32), beam_size=1)
+        list(segments)
+
+    def transcribe(self, payload, sample_rate) -> str:
+        import numpy as np
+
+        # Float WAVs (see batch.WavSource) arrive as float32, already in [-1, 1]
+        samples = np.concatenate(encoders.to_pcm16(payload)) if payload else np.zeros(0, np.int16)
+        audio = samples.astype(np.float32) / 32768
+        if sample_rate != self.SAMPLE_RATE:
+            positions = np.arange(0, len(audio), sample_rate / self.SAMPLE_RATE)
+            audio = np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+        segments, _ = self.load().transcribe(audio, beam_size=1)
+        return ' '.join(segment.text.strip() for segment in segments).strip()
+
+BACKENDS = ['openai', 'local']
+
+def create(name: str, get_client: Callable) -> Transcriber:
+    if name == 'local':
+        return LocalTranscriber()
+    if name == 'openai':
+        return OpenAITranscriber(get_client)
+    raise ValueError(f"Unknown backend: {name}")
@@ -0,0 +1,95 @@
+"""
+Typing Engine: The fallback when pasting doesn't work.
+Text is typed in short chunks, one tool run each, with an explicit delay
+between keys, so every run finishes well inside its timeout. Progress is
+kept per chunk: after a timeout or crash the same tool is restarted (then
+the next one) at the first chunk that wasn't confirmed, instead of typing
+everything again. The tools can't tell how far they got, so whatever the
+stalled run typed of that chunk is typed again; the retry goes word by
+word, so a second stall repeats at most part of one word.
+
+The tools only read their text from argv or stdin up to EOF, so a single
+long-lived process couldn't confirm chunks; a run per chunk amortizes the
+fork over CHUNK characters (see `python tests/bench.py typing`).
+"""
+import re
+import time
+from typing import List
+from .config import CONFIG
+from .system import System
+from . import backends
+
+CHUNK = 48              # Characters per tool run (at most this much is typed twice after a stall)
+DELAY_MS = 6            # Between keystrokes; WHISPASTE_TYPE_DELAY_MS overrides
+RESTARTS = 1            # Retries of a failed chunk before moving to the next tool
+BASE_TIMEOUT = 2.0      # Per run, plus the expected typing time (with slack)
+KEY_OVERHEAD = 0.01     # Seconds per key on top of the delay, for the timeout estimate
+
+# Delay option per tool, inserted before the trailing '--'
+DELAY_FLAGS = {
+    'wtype': ['-d', '{ms}'],
+    'ydotool': ['--key-delay', '{ms}'],
+    'xdotool': ['--delay', '{ms}'],
+}
+WORDS = re.compile(r'\s*\S+\s*|\s+')
+
+def split(text: str, size: int = CHUNK) -> List[str]:
+    """
+    Cut text into chunks of about size characters, after whitespace where
+    possible. Joining the chunks gives the text back exactly.
+    """
+    chunks = []
+    while len(text) > size:
+        cut = max(text.rfind(' ', 0, size), text.rfind('\n', 0, size)) + 1
+        if cut <= 0:
+            cut = size  # One long word
+        chunks.append(text[:cut])
+        text = text[cut:]
+    if text:
+        chunks.append(text)
+    return chunks
+
+def applescript_string(text: str) -> str:
+    """text as an AppleScript string literal."""
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def command(tool: List[str], chunk: str, delay_ms: int) -> List[str]:
+    """The full command line typing chunk with a 'type' backend command."""
+    name = re.split(r'[\\/]', tool[0])[-1]
+    if name == 'osascript':
+        return tool + [f'tell application "System Events" to keystroke {applescript_string(chunk)}']
+    flags = [flag.format(ms=delay_ms) for flag in DELAY_FLAGS.get(name, [])]
+    if flags and tool[-1] == '--':
+        return tool[:-1] + flags + ['--', chunk]
+    return tool + [chunk]
+
+def type_text(text: str) -> bool:
+    """
+    Type text into the focused window. True once every chunk is confirmed.
+    """
+    chunks = split(text)
+    delay_ms = int(CONFIG.setting('type_delay_ms', DELAY_MS))
+    done = 0
+    start = time.perf_counter()
+    for tool in backends.commands('type'):
+        failures = 0
+        while done < len(chunks):
+            chunk = chunks[done]
+            timeout = BASE_TIMEOUT + len(chunk) * (delay_ms / 1000 + KEY_OVERHEAD) * 3
+            if System.run(command(tool, chunk, delay_ms), timeout=timeout):
+                done += 1
+                failures = 0
+                continue
+            failures += 1
+            if failures > RESTARTS:
+                break
+            System.log(f"Typing: {tool[0]} failed at chunk {done + 1}/{len(chunks)}, restarting there word by word")
+            # Smaller runs confirm more often, so another stall costs less
+            chunks[done:done + 1] = WORDS.findall(chunk)
+        if done == len(chunks):
+            seconds = time.perf_counter() - start
+            System.log(f"Typing: {len(text)} chars in {seconds:.2f}s ({len(text) / max(seconds, 1e-9):.0f}/s)")
+            return True
+        if done:
+            System.log(f"Typing: {tool[0]} gave up after {done}/{len(chunks)} chunks; resuming with the next tool")
+    return False
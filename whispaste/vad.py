@@ -0,0 +1,146 @@
+"""
+Voice Activity Detection: Trim silence before upload.
+Frame energy plus zero-crossing rate, vectorized with NumPy.
+Works on a list of chunks (zero-copy views of the capture buffer) and
+returns views again, so trimming never copies the recording.
+"""
+from typing import List, Optional, Tuple
+
+FRAME_MS = 20          # Analysis frame
+PAD_MS = 200           # Silence kept around speech (so words aren't clipped)
+MIN_ENERGY = 0.003     # Absolute RMS floor (~-50 dBFS); quieter is never speech
+NOISE_FACTOR = 3.0     # Speech must be this much louder than the noise floor...
+MAX_THRESHOLD = 0.02   # ...capped here (~-34 dBFS) so steady speech still counts
+ZCR_RANGE = (0.1, 0.5) # Zero-crossing rate of unvoiced speech (s, f, sh...)
+
+def _as_chunks(audio) -> List:
+    if isinstance(audio, (list, tuple)):
+        return [chunk.reshape(-1) for chunk in audio]
+    return [audio.reshape(-1)]
+
+def _features(chunk, frame: int):
+    """
+    Per-frame RMS energy (full scale = 1.0) and zero-crossing rate.
+    A trailing partial frame is analysed as a short frame of its own.
+    """
+    import numpy as np
+
+    scale = 1 / 32768 if chunk.dtype == np.int16 else 1.0
+    count = len(chunk) // frame
+    parts = [chunk[:count * frame].reshape(count, frame)]
+    if len(chunk) % frame:
+        parts.append(chunk[count * frame:].reshape(1, -1))
+
+    energy, zcr = [], []
+    for frames in parts:
+        if not frames.size:
+            continue
+        frames = frames.astype(np.float32) * scale
+        energy.append(np.sqrt(np.mean(np.square(frames), axis=1)))
+        zcr.append(np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+                   if frames.shape[1] > 1 else np.zeros(len(frames)))
+    if not energy:
+        return np.zeros(0, np.float32), np.zeros(0, np.float32)
+    return np.concatenate(energy), np.concatenate(zcr)
+
+def speech_mask(audio, sample_rate: int):
+    """
+    Classify frames as speech (True) or silence (False), padding included.
+    Returns one frame mask for the whole input (chunks are analysed in order).
+    """
+    import numpy as np
+
+    frame = int(sample_rate * FRAME_MS / 1000)
+    features = [_features(chunk, frame) for chunk in _as_chunks(audio)]
+    if not features:
+        return np.zeros(0, dtype=bool)
+    energy = np.concatenate([e for e, _ in features])
+    zcr = np.concatenate([z for _, z in features])
+    if not len(energy):
+        return np.zeros(0, dtype=bool)
+
+    # Adapt to the room: the quietest frames are the noise floor. The cap keeps
+    # recordings without any pause (floor == speech level) from being dropped.
+    floor = float(np.percentile(energy, 10))
+    threshold = max(MIN_ENERGY, min(floor * NOISE_FACTOR, MAX_THRESHOLD))
+    voiced = energy > threshold
+    # Fricatives are quiet but noisy; accept them at half the threshold
+    unvoiced = (energy > threshold / 2) & (zcr >= ZCR_RANGE[0]) & (zcr <= ZCR_RANGE[1])
+    mask = voiced | unvoiced
+
+    # Keep some padding around each speech run (dilate the mask)
+    pad = max(1, PAD_MS // FRAME_MS)
+    return np.convolve(mask, np.ones(2 * pad + 1), mode='same') > 0
+
+def trim_silence(audio, sample_rate: int) -> Tuple[Optional[List], float]:
+    """
+    Drop leading/trailing silence and shorten long pauses.
+    Returns (list of kept views or None if nothing was spoken, seconds removed).
+    """
+    import numpy as np
+
+    chunks = _as_chunks(audio)
+    mask = speech_mask(chunks, sample_rate)
+    total = sum(len(chunk) for chunk in chunks) / sample_rate
+    if not mask.any():
+        return None, total
+
+    frame = int(sample_rate * FRAME_MS / 1000)
+    kept, index = [], 0
+    for chunk in chunks:
+        frames = -(-len(chunk) // frame)  # ceil: partial frame counts
+        local = mask[index:index + frames]
+        index += frames
+        # Run boundaries of the kept frames, in samples
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], local, [False]]).astype(np.int8)))
+        for start, end in zip(edges[::2], edges[1::2]):
+            kept.append(chunk[start * frame:min(end * frame, len(chunk))])
+
+    removed = total - sum(len(view) for view in kept) / sample_rate
+    return kept, removed
+
+class Endpointer:
+    """
+    Incremental end-of-speech detection for auto-stop, fed from the audio
+    callback. Reports the end once speech has been heard and then
+    silence_seconds of silence follow, or when nothing is said for
+    NO_SPEECH_SECONDS. One RMS per block; the noise floor adapts as it goes.
+    """
+    MIN_SPEECH = 0.2            # Seconds of voiced audio before we listen for the end
+    NO_SPEECH_SECONDS = 10.0    # Give up if nobody starts talking
+    FLOOR_RISE = 0.2            # Per second: how fast the noise floor follows a louder room
+
+    def __init__(self, sample_rate: int, silence_seconds: float = 1.0):
+        self.sample_rate = sample_rate
+        self.silence_samples = int(silence_seconds * sample_rate)
+        self.floor = MIN_ENERGY
+        self.speech = 0         # Voiced samples so far
+        self.silence = 0        # Samples since the last voiced block
+        self.total = 0
+
+    def feed(self, block) -> bool:
+        """True once the speaker is done (keep calling; it stays True)."""
+        import numpy as np
+
+        samples = block.reshape(-1)
+        if not len(samples):
+            return False
+        scale = 1 / 32768 if samples.dtype == np.int16 else 1.0
+        energy = float(np.sqrt(np.mean(np.square(samples, dtype=np.float32)))) * scale
+
+        threshold = max(MIN_ENERGY, min(self.floor * NOISE_FACTOR, MAX_THRESHOLD))
+        if energy > threshold:
+            self.speech += len(samples)
+            self.silence = 0
+        else:
+            self.silence += len(samples)
+        # Quieter blocks pull the floor down at once, louder ones raise it slowly
+        if energy < self.floor:
+            self.floor = energy
+        else:
+            self.floor += (energy - self.floor) * min(1.0, self.FLOOR_RISE * len(samples) / self.sample_rate)
+        self.total += len(samples)
+
+        if self.speech >= self.MIN_SPEECH * self.sample_rate:
+            return self.silence >= self.silence_samples
+        return self.total >= self.NO_SPEECH_SECONDS * self.sample_rate